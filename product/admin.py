@@ -1,7 +1,15 @@
 from django.contrib import admin
 from django import forms
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
 from .models import Category, Product, ProductAttribute, ProductAttributeItem, ProductImage
 
 # Change admin site title
@@ -9,6 +17,114 @@ admin.site.site_header = "Ravvio Admin"
 admin.site.site_title = "Ravvio Admin Portal"
 admin.site.index_title = "Welcome to Ravvio Admin Portal"
 
+
+def estimated_row_count(model, using):
+    """The row count of model's table in the database statistics, or None when there are none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # -1 until the table is first vacuumed or analyzed
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)", [connection.ops.quote_name(table)]
+            )
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 exists once ANALYZE (or PRAGMA optimize) has run
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of each index's stat is the row count of the table
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    count = int(float(str(row[0]).split()[0]))
+    return count if count >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the row count of an unfiltered changelist of a big
+    table from the database statistics, instead of an exact COUNT(*) that
+    scans the whole table on every page load. The count may be off by the
+    rows changed since the statistics were last gathered.
+    """
+    # Below this many rows an exact count is cheap enough
+    estimate_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    List filter on a foreign key that picks the object with the admin's
+    autocomplete widget, instead of listing every row of the related table
+    in the sidebar. The related model's admin needs search_fields.
+
+        list_filter = [('product', AutocompleteFilter)]
+    """
+    template = 'admin/product/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=self.get_widget(field, model_admin.admin_site),
+            required=False,
+        )
+        self.query_string = ''
+
+    @staticmethod
+    def get_widget(field, admin_site):
+        return AutocompleteSelect(field, admin_site, attrs={'style': 'width: 100%'})
+
+    @classmethod
+    def get_media(cls, field, admin_site):
+        return cls.get_widget(field, admin_site).media + forms.Media(js=['product/admin/autocomplete_filter.js'])
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # The script sets the picked object on this query string
+        self.query_string = changelist.get_query_string(remove=[self.lookup_kwarg])
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': self.query_string,
+            'display': _('All'),
+        }
+
+    def widget(self):
+        return self.form_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+
+class AutocompleteFilterMixin:
+    """Adds the media of the AutocompleteFilters in list_filter."""
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, (list, tuple)) and issubclass(list_filter[1], AutocompleteFilter):
+                field = get_fields_from_path(self.model, list_filter[0])[-1]
+                media += list_filter[1].get_media(field, self.admin_site)
+        return media
+
+
 # Inline for product attributes
 class ProductAttributeItemInline(admin.TabularInline):
     model = ProductAttributeItem
@@ -51,17 +167,35 @@ class ProductAdmin(admin.ModelAdmin):
     inlines = [ProductAttributeItemInline, ProductImageInline]
     list_display = ['name', 'price', 'category_obj', 'view_attributes']
     list_filter = ['category_obj']
+    list_select_related = ['category_obj']
     search_fields = ['name', 'description']
     autocomplete_fields = ['category_obj']
-    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # A correlated count per row of the page, rather than a query per row
+        # or a GROUP BY over the whole join
+        attribute_counts = (
+            ProductAttributeItem.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+        return super().get_queryset(request).annotate(
+            attribute_count=Coalesce(Subquery(attribute_counts), 0)
+        )
+
     def view_attributes(self, obj):
-        count = obj.attributes.count()
+        count = obj.attribute_count
         if count:
             url = reverse('admin:product_productattributeitem_changelist') + f'?product__id__exact={obj.id}'
             return format_html('<a href="{}">View {} Attributes</a>', url, count)
         return "No attributes"
     
     view_attributes.short_description = "Attributes"
+    view_attributes.admin_order_field = 'attribute_count'
     
     class Media:
         css = {
@@ -71,16 +205,22 @@ class ProductAdmin(admin.ModelAdmin):
 
 # Register ProductAttributeItem separately for direct access if needed
 @admin.register(ProductAttributeItem)
-class ProductAttributeItemAdmin(admin.ModelAdmin):
+class ProductAttributeItemAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ['product', 'attribute', 'value']
-    list_filter = ['product', 'attribute']
+    list_filter = [('product', AutocompleteFilter), ('attribute', AutocompleteFilter)]
+    list_select_related = ['product', 'attribute']
     search_fields = ['product__name', 'attribute__name', 'value']
     autocomplete_fields = ['product', 'attribute']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # Register ProductImage separately for direct access if needed
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ['product', 'image', 'order', 'caption']
-    list_filter = ['product']
+    list_filter = [('product', AutocompleteFilter)]
+    list_select_related = ['product']
     search_fields = ['product__name', 'caption']
     autocomplete_fields = ['product']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
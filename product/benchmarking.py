@@ -0,0 +1,88 @@
+"""Helpers shared by the benchmark management commands."""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def measure(func):
+    """Run `func` once and return (elapsed seconds, number of queries, result)."""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries), result
+
+
+def summarize(timings):
+    """Milliseconds statistics of a list of durations in seconds."""
+    timings_ms = sorted(t * 1000 for t in timings)
+    return {
+        'min_ms': round(timings_ms[0], 3),
+        'median_ms': round(statistics.median(timings_ms), 3),
+        'max_ms': round(timings_ms[-1], 3),
+    }
+
+
+def percentiles(timings, points=(50, 95, 99)):
+    """Milliseconds percentiles of a list of durations in seconds, interpolated between samples."""
+    timings_ms = sorted(t * 1000 for t in timings)
+    if len(timings_ms) == 1:
+        return {f'p{point}_ms': round(timings_ms[0], 3) for point in points}
+    cuts = statistics.quantiles(timings_ms, n=100, method='inclusive')
+    return {f'p{point}_ms': round(cuts[point - 1], 3) for point in points}
+
+
+def compare_results(baseline, results, tolerance):
+    """
+    Table rows comparing {name: stats} results with a baseline, and the list
+    of regressions: a p95 more than `tolerance` (a fraction) slower, or more
+    queries per request.
+    """
+    def change(before, after):
+        return f'{(after - before) / before:+.0%}' if before else ''
+
+    rows, regressions = [], []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append([name, '', stats['p50_ms'], '', '', stats['p95_ms'], '', '', stats['queries']])
+            continue
+        rows.append([
+            name,
+            before['p50_ms'], stats['p50_ms'], change(before['p50_ms'], stats['p50_ms']),
+            before['p95_ms'], stats['p95_ms'], change(before['p95_ms'], stats['p95_ms']),
+            before['queries'], stats['queries'],
+        ])
+        if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {stats['p95_ms']} ms")
+        if stats['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {stats['queries']} queries per request")
+    return rows, regressions
+
+
+def format_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    lines = [
+        '  '.join(str(value).rjust(width) for value, width in zip(row, widths))
+        for row in [headers, *rows]
+    ]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
@@ -0,0 +1,263 @@
+"""
+Versioned response cache and HTTP validators for the catalog endpoints.
+
+Cached responses and ETags are derived from the request and from the current
+value of the version counters ("scopes") the response depends on. Writes never
+delete cache entries; they bump the counters instead, so stale entries simply
+stop being addressed and age out of the backend.
+
+The counters live in their own cache, which every worker shares and which
+never culls them (see ravvio/caches.py).
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from ravvio.replicas import pin_recent_writes
+
+VERSION_PREFIX = 'catalog:version:'
+STATS_PREFIX = 'catalog:stats:'
+RESPONSE_PREFIX = 'catalog:response:'
+
+# Every product list page
+CATALOG = 'catalog'
+# Every category name (nested in product responses)
+CATEGORIES = 'categories'
+# Every attribute name (nested in product responses)
+ATTRIBUTES = 'attributes'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'CATALOG_VERSIONS_CACHE_ALIAS', 'default')]
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def product_scope(product_id):
+    # "05" from a URL is the same product as 5
+    if isinstance(product_id, str) and product_id.isdigit():
+        product_id = int(product_id)
+    return f'product:{product_id}'
+
+
+def get_versions(scopes):
+    """Return the current version of each scope, initializing missing ones."""
+    cache = get_version_cache()
+    keys = {VERSION_PREFIX + scope: scope for scope in scopes}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, scope in keys.items():
+        if key not in found:
+            # Seed from the clock so an evicted counter never revisits an old version
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    # Versions are the times of the writes; data read for them must include those writes
+    pin_recent_writes(max(versions.values(), default=0))
+    return versions
+
+
+def bump_versions(*scopes):
+    # A new timestamp rather than incr(): every backend sets a key atomically,
+    # but the file backend increments with a read and a write
+    version = time.time_ns()
+    get_version_cache().set_many({VERSION_PREFIX + scope: version for scope in set(scopes)}, timeout=None)
+
+
+def invalidate(*scopes):
+    """Bump scopes once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(lambda: bump_versions(*scopes))
+
+
+def invalidate_product(product_id, *category_ids):
+    scopes = [CATALOG, product_scope(product_id)]
+    scopes += [category_scope(pk) for pk in category_ids if pk is not None]
+    invalidate(*scopes)
+
+
+def invalidate_products(product_ids, category_ids):
+    scopes = [CATALOG]
+    scopes += [product_scope(pk) for pk in product_ids]
+    scopes += [category_scope(pk) for pk in category_ids if pk is not None]
+    invalidate(*scopes)
+
+
+def invalidate_category(category_id):
+    invalidate(CATALOG, CATEGORIES, category_scope(category_id))
+
+
+def invalidate_attributes():
+    invalidate(ATTRIBUTES)
+
+
+def record(outcome):
+    cache = get_cache()
+    key = STATS_PREFIX + outcome
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    stats = cache.get_many([STATS_PREFIX + 'hit', STATS_PREFIX + 'miss'])
+    hits = stats.get(STATS_PREFIX + 'hit', 0)
+    misses = stats.get(STATS_PREFIX + 'miss', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def normalize_query(query_params):
+    """Order-independent form of the query string with empty parameters dropped."""
+    return sorted(
+        (key, sorted(value for value in query_params.getlist(key) if value != ''))
+        for key in query_params
+        if any(value != '' for value in query_params.getlist(key))
+    )
+
+
+class VersionedViewMixin:
+    """
+    Views whose responses are a function of the request and some version counters.
+
+    Views list the counters in `cache_scopes`, or override `get_cache_scopes()`
+    when they depend on the request.
+    """
+    cache_scopes = ()
+
+    def get_cache_scopes(self):
+        return list(self.cache_scopes)
+
+    def get_request_fingerprint(self, request, *extra):
+        """Digest of everything that selects the response body."""
+        versions = get_versions(self.get_cache_scopes())
+        parts = [
+            self.basename,
+            self.action,
+            # Pagination links are absolute, so the host is part of the response
+            request.get_host(),
+            request.is_secure(),
+            sorted(self.kwargs.items()),
+            normalize_query(request.query_params),
+            sorted(versions.items()),
+            *extra,
+        ]
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class CachedResponseMixin(VersionedViewMixin):
+    """Serve `cached_actions` from the catalog cache."""
+    cached_actions = ('list', 'retrieve')
+
+    def get_response_cache_key(self, request):
+        return RESPONSE_PREFIX + self.get_request_fingerprint(request)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record('hit')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record('miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cached_actions:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cached_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin(VersionedViewMixin):
+    """
+    Strong ETag validators for list and retrieve, and Last-Modified for retrieve.
+
+    The ETag is derived from the version counters, so answering a matching
+    If-None-Match with 304 costs no database query and no serialization.
+    Last-Modified is a max(updated_at) aggregate over `last_modified_fields`
+    and is only computed when the client did not send an ETag to compare.
+    Lists get none: the aggregate would repeat the page's filters and search
+    on every request, cache hits included, and a row deleted from a list
+    leaves no updated_at behind to move it forward.
+    """
+    conditional_actions = ('list', 'retrieve')
+    last_modified_actions = ('retrieve',)
+    last_modified_fields = ('updated_at',)
+
+    def get_etag(self, request):
+        # The same data rendered as JSON or as the browsable API is a different representation
+        return '"%s"' % self.get_request_fingerprint(request, request.accepted_media_type)
+
+    def get_last_modified(self, request):
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        else:
+            queryset = self.filter_queryset(queryset)
+        aggregates = queryset.aggregate(*[Max(field) for field in self.last_modified_fields])
+        timestamps = [value for value in aggregates.values() if value is not None]
+        return max(timestamps) if timestamps else None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        last_modified = None
+        if self.action in self.last_modified_actions and 'HTTP_IF_NONE_MATCH' not in request.META:
+            last_modified = self.get_last_modified(request)
+        last_modified_timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified_timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified_timestamp is not None:
+            response['Last-Modified'] = http_date(last_modified_timestamp)
+        # Clients may store the response but must revalidate before reusing it
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.conditional_actions:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.conditional_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
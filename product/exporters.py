@@ -0,0 +1,74 @@
+"""
+Streaming catalog export as JSONL or CSV.
+
+Products are read with a chunked `.iterator()` over the prefetching queryset,
+so each chunk costs a constant number of queries, memory stays flat however
+large the catalog is, and the first line is written after the first chunk.
+The CSV layout matches what product.importers reads back, except that images
+are written as URLs.
+"""
+import csv
+import json
+
+FORMATS = ('jsonl', 'csv')
+CSV_COLUMNS = ['id', 'name', 'description', 'price', 'category', 'attributes', 'images']
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+CHUNK_SIZE = 500
+
+
+def iter_products(queryset, chunk_size=CHUNK_SIZE):
+    return queryset.with_related().iterator(chunk_size=chunk_size)
+
+
+def product_record(product, build_url):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category_obj.name,
+        'category_id': product.category_obj_id,
+        'attributes': [
+            {'name': item.attribute.name, 'value': item.value}
+            for item in product.attributes.all()
+        ],
+        'images': [build_url(image.image.url) for image in product.images.all()],
+    }
+
+
+def export_jsonl(queryset, build_url=str):
+    for product in iter_products(queryset):
+        yield json.dumps(product_record(product, build_url), ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(queryset, build_url=str):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for product in iter_products(queryset):
+        record = product_record(product, build_url)
+        yield writer.writerow([
+            record['id'],
+            record['name'],
+            record['description'],
+            '' if record['price'] is None else record['price'],
+            record['category'],
+            '; '.join(f"{item['name']}={item['value']}" for item in record['attributes']),
+            '|'.join(record['images']),
+        ])
+
+
+def export(queryset, format, build_url=str):
+    """Generator of text chunks for the given format."""
+    if format == 'csv':
+        return export_csv(queryset, build_url)
+    return export_jsonl(queryset, build_url)
@@ -0,0 +1,161 @@
+"""
+Facet counts for the catalog: products per category and per attribute value.
+
+The counts live in two aggregate tables, CategoryFacet and
+AttributeValueFacet (per category, attribute and value). Writes mark the
+categories and (attribute, value) pairs they affect, and only those keys are
+recounted, each through an index, in the same transaction as the change.
+Reading the facets of the whole catalog or of one category never scans the
+products.
+
+Concurrent writers recounting the same keys take turns: a recount first
+locks the categories or attributes it covers (FOR NO KEY UPDATE, which
+inserts referencing them do not wait for), so on PostgreSQL it counts after
+the previous writer committed rather than from an older snapshot, and
+upserts the counts in place. SQLite transactions exclude each other already.
+
+Requests narrowed by search or other filters are counted live over the
+matching products instead.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from .models import AttributeValueFacet, Category, CategoryFacet, Product, ProductAttribute, ProductAttributeItem
+
+# Attribute values recounted per query
+CHUNK_SIZE = 200
+
+
+def value_filter(keys):
+    by_attribute = defaultdict(set)
+    for attribute_id, value in keys:
+        by_attribute[attribute_id].add(value)
+    condition = Q()
+    for attribute_id, values in by_attribute.items():
+        condition |= Q(attribute_id=attribute_id, value__in=values)
+    return condition
+
+
+def refresh_categories(category_ids):
+    """Recount the products of the given categories."""
+    with transaction.atomic(savepoint=False):
+        category_ids = set(
+            Category.objects.filter(pk__in=category_ids).order_by('pk')
+            .select_for_update(no_key=True).values_list('pk', flat=True)
+        )
+        if not category_ids:
+            return
+        counts = dict(
+            Product.objects.filter(category_obj_id__in=category_ids)
+            .order_by().values_list('category_obj_id').annotate(Count('id'))
+        )
+        CategoryFacet.objects.bulk_create(
+            [CategoryFacet(category_id=pk, product_count=counts.get(pk, 0)) for pk in category_ids],
+            update_conflicts=True,
+            unique_fields=['category'],
+            update_fields=['product_count'],
+        )
+
+
+def refresh_attribute_values(keys):
+    """Recount the products carrying each (attribute id, value) pair, per category."""
+    keys = sorted(keys)
+    if not keys:
+        return
+    with transaction.atomic(savepoint=False):
+        if connection.features.has_select_for_update:
+            list(
+                ProductAttribute.objects.filter(pk__in={attribute_id for attribute_id, _ in keys}).order_by('pk')
+                .select_for_update(no_key=True).values_list('pk', flat=True)
+            )
+        for start in range(0, len(keys), CHUNK_SIZE):
+            condition = value_filter(keys[start:start + CHUNK_SIZE])
+            counts = (
+                ProductAttributeItem.objects.filter(condition)
+                .order_by().values_list('product__category_obj_id', 'attribute_id', 'value')
+                .annotate(Count('product_id', distinct=True))
+            )
+            facets = {
+                (category_id, attribute_id, value): AttributeValueFacet(
+                    category_id=category_id, attribute_id=attribute_id, value=value, product_count=count
+                )
+                for category_id, attribute_id, value, count in counts
+            }
+            # Values a category no longer carries
+            categories = defaultdict(set)
+            for category_id, attribute_id, value in facets:
+                categories[attribute_id, value].add(category_id)
+            stale = Q()
+            for attribute_id, value in keys[start:start + CHUNK_SIZE]:
+                stale |= Q(attribute_id=attribute_id, value=value) & ~Q(
+                    category_id__in=categories[attribute_id, value]
+                )
+            AttributeValueFacet.objects.filter(stale).delete()
+            AttributeValueFacet.objects.bulk_create(
+                facets.values(),
+                update_conflicts=True,
+                unique_fields=['attribute', 'value', 'category'],
+                update_fields=['product_count'],
+            )
+
+
+def product_values(product_ids):
+    """The (attribute id, value) pairs the given products carry."""
+    return set(
+        ProductAttributeItem.objects.filter(product_id__in=product_ids).values_list('attribute_id', 'value')
+    )
+
+
+def rebuild():
+    """Recount every facet from scratch. Returns the number of facet rows written."""
+    CategoryFacet.objects.all().delete()
+    AttributeValueFacet.objects.all().delete()
+    refresh_categories(Category.objects.values_list('pk', flat=True))
+    refresh_attribute_values(ProductAttributeItem.objects.values_list('attribute_id', 'value').distinct())
+    return CategoryFacet.objects.count() + AttributeValueFacet.objects.count()
+
+
+def precomputed_counts(category_id=None):
+    """Facet counts of the whole catalog, or of one category, from the aggregate tables."""
+    categories = CategoryFacet.objects.filter(product_count__gt=0)
+    values = AttributeValueFacet.objects.all()
+    if category_id is not None:
+        categories = categories.filter(category_id=category_id)
+        values = values.filter(category_id=category_id)
+    return (
+        categories.values_list('category_id', 'category__name', 'product_count'),
+        # A product belongs to one category, so per-category counts add up
+        values.values_list('attribute_id', 'attribute__name', 'value').annotate(Sum('product_count')),
+    )
+
+
+def live_counts(products):
+    """Facet counts over an arbitrary product queryset, for filters the tables do not cover."""
+    product_ids = products.order_by().values('id')
+    categories = (
+        Product.objects.filter(id__in=product_ids)
+        .values_list('category_obj_id', 'category_obj__name').annotate(Count('id'))
+    )
+    values = (
+        ProductAttributeItem.objects.filter(product_id__in=product_ids)
+        .values_list('attribute_id', 'attribute__name', 'value').annotate(Count('product_id', distinct=True))
+    )
+    return categories, values
+
+
+def format_counts(categories, values):
+    attributes = {}
+    for attribute_id, name, value, count in values:
+        attribute = attributes.setdefault(attribute_id, {'id': attribute_id, 'name': name, 'values': []})
+        attribute['values'].append({'value': value, 'count': count})
+    for attribute in attributes.values():
+        attribute['values'].sort(key=lambda item: (-item['count'], item['value']))
+    return {
+        'categories': sorted(
+            ({'id': pk, 'name': name, 'count': count} for pk, name, count in categories),
+            key=lambda item: item['name'],
+        ),
+        'attributes': sorted(attributes.values(), key=lambda item: item['name']),
+    }
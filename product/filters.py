@@ -0,0 +1,97 @@
+"""
+Attribute value filters for the product list.
+
+    ?attr[RAM]=16GB                 products whose RAM is 16GB
+    ?attr[RAM]=16GB,32GB            ...16GB or 32GB (repeating the parameter works too)
+    ?attr[RAM]=16..&attr[Storage]=..512
+                                    RAM of at least 16 and Storage of at most 512
+
+Ranges compare the number a value starts with (`value_numeric`). Different
+attributes must all match. Every attribute becomes one `id IN (...)`
+subquery served by the (attribute, value, product) or (attribute,
+value_numeric, product) index.
+"""
+import re
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import ProductAttribute, ProductAttributeItem
+
+PARAM_RE = re.compile(r'^attr\[(?P<name>[^\]]+)\]$')
+NUMBER_RE = re.compile(r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)')
+RANGE_SEPARATOR = '..'
+
+
+def parse_bound(param, bound):
+    if bound == '':
+        return None
+    if not NUMBER_RE.fullmatch(bound):
+        raise ValidationError({param: f'"{bound}" is not a number.'})
+    return float(bound)
+
+
+def parse_attribute_filters(query_params):
+    """{attribute name: (exact values, [(low, high), ...])} from the attr[...] parameters."""
+    filters = {}
+    for param in query_params:
+        match = PARAM_RE.match(param)
+        if match is None:
+            continue
+        values, ranges = filters.setdefault(match.group('name').strip(), (set(), []))
+        for raw in query_params.getlist(param):
+            for term in (term.strip() for term in raw.split(',')):
+                if not term:
+                    continue
+                if RANGE_SEPARATOR in term:
+                    low, high = (bound.strip() for bound in term.split(RANGE_SEPARATOR, 1))
+                    if not low and not high:
+                        raise ValidationError({param: 'A range needs at least one bound.'})
+                    ranges.append((parse_bound(param, low), parse_bound(param, high)))
+                else:
+                    values.add(term)
+    return {name: condition for name, condition in filters.items() if any(condition)}
+
+
+class AttributeFilterBackend(BaseFilterBackend):
+    """`?attr[<attribute name>]=<value>` filters, see the module docstring."""
+
+    def filter_queryset(self, request, queryset, view):
+        filters = parse_attribute_filters(request.query_params)
+        if not filters:
+            return queryset
+        attribute_ids = dict(ProductAttribute.objects.filter(name__in=filters).values_list('name', 'id'))
+        if len(attribute_ids) < len(filters):
+            # An attribute no product has matches nothing
+            return queryset.none()
+
+        for name, (values, ranges) in filters.items():
+            condition = Q()
+            if values:
+                condition |= Q(value__in=values)
+            for low, high in ranges:
+                bounds = Q()
+                if low is not None:
+                    bounds &= Q(value_numeric__gte=low)
+                if high is not None:
+                    bounds &= Q(value_numeric__lte=high)
+                condition |= bounds
+            items = ProductAttributeItem.objects.filter(condition, attribute_id=attribute_ids[name])
+            queryset = queryset.filter(id__in=items.values('product_id'))
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": "attr",
+                "required": False,
+                "in": "query",
+                "style": "deepObject",
+                "explode": True,
+                "description": "Attribute filters: attr[RAM]=16GB, several values as attr[RAM]=16GB,32GB, "
+                               "numeric ranges as attr[RAM]=8..32, attr[RAM]=8.. or attr[RAM]=..32. "
+                               "Different attributes must all match.",
+                "schema": {"type": "object", "additionalProperties": {"type": "string"}},
+            },
+        ]
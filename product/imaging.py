@@ -0,0 +1,240 @@
+"""
+Derivative pipeline for product images.
+
+Every uploaded image gets resized variants (see PRODUCT_IMAGE_VARIANTS), each
+encoded as WebP, AVIF when Pillow supports it, and JPEG (PNG for images with
+transparency) as a fallback. Variants are written next to the original under
+`variants/` with names derived from the original's file name (extension
+included) and a digest of their own content, and recorded in
+`ProductImage.variants`. A variant rebuilt differently gets a new name, so
+its URL can be cached forever without a stat() to version it.
+
+Work is queued after the transaction commits and runs on a small thread pool,
+so uploads never wait for encoding. PRODUCT_IMAGE_PIPELINE = 'sync' runs it
+inline instead (tests, management commands).
+"""
+import hashlib
+import logging
+import posixpath
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import ProductImage
+from .signals import record_product_change
+from .storage import VARIANT_TOKEN_LENGTH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {
+    'thumb': 160,
+    'medium': 480,
+    'large': 1200,
+}
+QUALITY = {
+    'jpeg': 82,
+    'webp': 80,
+    'avif': 60,
+}
+EXTENSIONS = {
+    'jpeg': 'jpg',
+    'png': 'png',
+    'webp': 'webp',
+    'avif': 'avif',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_sizes():
+    return getattr(settings, 'PRODUCT_IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def get_encodings(has_alpha):
+    from PIL import features
+
+    encodings = ['png' if has_alpha else 'jpeg', 'webp']
+    if features.check('avif'):
+        encodings.append('avif')
+    return encodings
+
+
+def variants_directory(name):
+    return posixpath.join(posixpath.dirname(name), 'variants')
+
+
+def variant_name(name, variant, encoding, content):
+    """Where the `variant` of the image `name` is stored, encoded as `encoding` into the bytes `content`."""
+    # "photo.jpg" and "photo.png" must not share variants
+    filename = posixpath.basename(name)
+    token = hashlib.sha256(content).hexdigest()[:VARIANT_TOKEN_LENGTH]
+    return posixpath.join(variants_directory(name), f'{filename}_{variant}.{token}.{EXTENSIONS[encoding]}')
+
+
+def variant_name_re(name):
+    """Matches the file names of the variants of `name`, whatever their content."""
+    variants = '|'.join(re.escape(variant) for variant in get_variant_sizes())
+    extensions = '|'.join(EXTENSIONS.values())
+    return re.compile(
+        rf'^{re.escape(posixpath.basename(name))}_(?P<variant>{variants})'
+        rf'\.[0-9a-f]{{{VARIANT_TOKEN_LENGTH}}}\.(?P<extension>{extensions})$'
+    )
+
+
+def derived_names(storage, name):
+    """The names of every variant stored for the image `name`."""
+    directory = variants_directory(name)
+    if not storage.exists(directory):
+        return []
+    pattern = variant_name_re(name)
+    return [
+        posixpath.join(directory, filename) for filename in storage.listdir(directory)[1] if pattern.match(filename)
+    ]
+
+
+def stored_variants(storage, name):
+    """{(variant, extension): name} of the variants stored for `name`, the newest when rebuilt differently."""
+    pattern = variant_name_re(name)
+    found = {}
+    for derived in derived_names(storage, name):
+        match = pattern.match(posixpath.basename(derived))
+        found.setdefault((match['variant'], match['extension']), []).append(derived)
+    return {
+        key: names[0] if len(names) == 1 else max(names, key=storage.get_modified_time)
+        for key, names in found.items()
+    }
+
+
+def encode(image, encoding):
+    buffer = BytesIO()
+    options = {'quality': QUALITY[encoding]} if encoding in QUALITY else {'optimize': True}
+    if encoding == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    elif encoding == 'webp':
+        options.update(method=4)
+    image.save(buffer, format=encoding.upper(), **options)
+    return buffer.getvalue()
+
+
+def build_variants(storage, name, force=False):
+    """
+    Write every variant of the stored image `name`.
+
+    Returns the {variant: {encoding: name}} map. Variants that already exist
+    are reused unless `force` is set.
+    """
+    from PIL import Image, ImageOps
+
+    with storage.open(name, 'rb') as file:
+        source = Image.open(file)
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    has_alpha = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+
+    existing = {} if force else stored_variants(storage, name)
+    variants = {}
+    for variant, max_edge in sorted(get_variant_sizes().items(), key=lambda item: item[1]):
+        resized = None
+        variants[variant] = {}
+        for encoding in get_encodings(has_alpha):
+            target = existing.get((variant, EXTENSIONS[encoding]))
+            if target is None:
+                if resized is None:
+                    resized = source.copy()
+                    # Never upscale: small originals keep their size
+                    resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+                content = encode(resized, encoding)
+                target = variant_name(name, variant, encoding, content)
+                # Identical content is stored under the same name already
+                if not storage.exists(target):
+                    storage.save(target, ContentFile(content))
+            variants[variant][encoding] = target
+    return variants
+
+
+def process_image(image_id, force=False):
+    """Generate and record the variants of one ProductImage. Returns True on success."""
+    # Pillow is only imported by processes that encode images
+    from PIL import Image
+
+    image = ProductImage.objects.filter(pk=image_id).select_related('product').first()
+    if image is None or not image.image:
+        return False
+    try:
+        variants = build_variants(image.image.storage, image.image.name, force=force)
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning("Cannot build variants for %s: %s", image.image.name, exc)
+        return False
+
+    with transaction.atomic():
+        # Only record the variants if the image was not replaced in the meantime
+        updated = ProductImage.objects.filter(pk=image_id, image=image.image.name).update(variants=variants)
+        if updated:
+            record_product_change(image.product_id, image.product.category_obj_id, touch=True)
+    return bool(updated)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2),
+                thread_name_prefix='product-images',
+            )
+        return _executor
+
+
+def run_job(image_id):
+    close_old_connections()
+    try:
+        process_image(image_id)
+    except Exception:
+        logger.exception("Image variant job failed for ProductImage %s", image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(image_ids):
+    """Queue variant generation for the given images once the transaction commits."""
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    def submit():
+        if getattr(settings, 'PRODUCT_IMAGE_PIPELINE', 'thread') == 'sync':
+            for image_id in image_ids:
+                process_image(image_id)
+            return
+        executor = get_executor()
+        for image_id in image_ids:
+            executor.submit(run_job, image_id)
+
+    transaction.on_commit(submit)
+
+
+def has_current_variants(image):
+    """Whether `image.variants` was built from the file the image points at now."""
+    directory = variants_directory(image.image.name)
+    pattern = variant_name_re(image.image.name)
+    return any(
+        posixpath.dirname(name) == directory and pattern.match(posixpath.basename(name))
+        for encodings in image.variants.values()
+        for name in encodings.values()
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+def image_saved(sender, instance, **kwargs):
+    if instance.image and not has_current_variants(instance):
+        schedule([instance.pk])
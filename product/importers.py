@@ -0,0 +1,286 @@
+"""
+Streaming product import from CSV or JSONL.
+
+Rows are read one at a time and written in batches: every batch resolves its
+categories and attribute names against in-memory maps, then inserts its
+products, attribute items and images with bulk_create inside one transaction.
+Memory is bounded by the batch size and the number of distinct categories and
+attribute names, never by the size of the file.
+
+JSONL rows look like:
+
+    {"name": "...", "description": "...", "price": 9.5, "category": "Laptops",
+     "attributes": {"RAM": "16GB"}, "images": ["product_images/a.jpg"]}
+
+CSV files use the same column names; `attributes` holds either a JSON object
+or "Name=Value; Name=Value" pairs and `images` holds "|"-separated paths.
+"""
+import csv
+import io
+import json
+import math
+import posixpath
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+
+from . import cache, imaging
+from .models import Category, Product, ProductAttribute, ProductAttributeItem, ProductImage
+from .signals import batched_product_changes
+
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def guess_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension)
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, {'row': f'Invalid JSON: {exc}'}
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, {'row': 'Expected a JSON object.'}
+            continue
+        yield line_number, row, None
+
+
+def parse_csv_attributes(value):
+    value = (value or '').strip()
+    if not value:
+        return {}
+    if value.startswith('{'):
+        return json.loads(value)
+    pairs = [pair.split('=', 1) for pair in value.split(';') if pair.strip()]
+    if any(len(pair) != 2 for pair in pairs):
+        raise ValueError('expected "Name=Value; Name=Value"')
+    return {name.strip(): attribute_value.strip() for name, attribute_value in pairs}
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Header is line 1; multi-line quoted fields make line_num the last physical line
+        line_number = reader.line_num
+        try:
+            row['attributes'] = parse_csv_attributes(row.get('attributes'))
+        except ValueError as exc:
+            yield line_number, None, {'attributes': str(exc)}
+            continue
+        row['images'] = [path.strip() for path in (row.get('images') or '').split('|') if path.strip()]
+        yield line_number, row, None
+
+
+IMAGE_DIRECTORY = ProductImage._meta.get_field('image').upload_to
+
+
+def is_image_path(path):
+    """Whether `path` names a file inside the image directory, without climbing out of it."""
+    parts = path.split('/')
+    return (
+        '\\' not in path
+        and '..' not in parts
+        and posixpath.normpath(path) == path
+        and parts[0] == IMAGE_DIRECTORY
+        and len(parts) > 1
+    )
+
+
+def clean_row(row):
+    """Validate one parsed row. Returns (cleaned row, errors)."""
+    errors = {}
+    cleaned = {}
+
+    name = row.get('name')
+    if not isinstance(name, str) or not name.strip():
+        errors['name'] = 'This field is required.'
+    elif len(name) > Product._meta.get_field('name').max_length:
+        errors['name'] = 'Ensure this field has no more than 200 characters.'
+    else:
+        cleaned['name'] = name.strip()
+
+    description = row.get('description') or ''
+    cleaned['description'] = description if isinstance(description, str) else str(description)
+
+    price = row.get('price')
+    if price in (None, ''):
+        cleaned['price'] = None
+    else:
+        try:
+            cleaned['price'] = float(price)
+        except (TypeError, ValueError):
+            errors['price'] = 'A valid number is required.'
+        else:
+            if not math.isfinite(cleaned['price']):
+                errors['price'] = 'A valid number is required.'
+
+    category = row.get('category')
+    if not isinstance(category, str) or not category.strip():
+        errors['category'] = 'This field is required.'
+    elif len(category.strip()) > Category._meta.get_field('name').max_length:
+        errors['category'] = 'Ensure this field has no more than 100 characters.'
+    else:
+        cleaned['category'] = category.strip()
+
+    attributes = row.get('attributes') or {}
+    if isinstance(attributes, list):
+        try:
+            attributes = {item['name']: item['value'] for item in attributes}
+        except (KeyError, TypeError):
+            errors['attributes'] = 'Expected objects with "name" and "value".'
+    if not isinstance(attributes, dict):
+        errors['attributes'] = 'Expected an object of attribute name to value.'
+    elif 'attributes' not in errors:
+        max_length = ProductAttribute._meta.get_field('name').max_length
+        if any(not isinstance(key, str) or not key.strip() or len(key) > max_length for key in attributes):
+            errors['attributes'] = 'Attribute names must be non-empty strings of at most 100 characters.'
+        else:
+            cleaned['attributes'] = {key.strip(): str(value) for key, value in attributes.items()}
+
+    images = row.get('images') or []
+    if not isinstance(images, list) or not all(isinstance(path, str) and path for path in images):
+        errors['images'] = 'Expected a list of image paths.'
+    elif not all(is_image_path(path) for path in images):
+        errors['images'] = f'Image paths must be relative paths under {IMAGE_DIRECTORY}/.'
+    else:
+        cleaned['images'] = images
+
+    return cleaned, errors
+
+
+class ProductImporter:
+    def __init__(self, batch_size=500, create_categories=True, max_errors=1000):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.categories = {}
+        self.attributes = {}
+        self.result = ImportResult(max_errors)
+
+    def run(self, stream, format):
+        """Import a text stream in the given format and return an ImportResult."""
+        reader = read_csv if format == 'csv' else read_jsonl
+        rows = reader(stream)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return self.result
+            self.import_batch(batch)
+
+    def run_file(self, file, format, encoding='utf-8'):
+        """Import a binary file object, e.g. an upload, decoding it incrementally."""
+        stream = io.TextIOWrapper(file, encoding=encoding, newline='')
+        try:
+            return self.run(stream, format)
+        finally:
+            # Leave closing the underlying file to its owner
+            stream.detach()
+
+    def import_batch(self, batch):
+        rows = []
+        for line_number, row, errors in batch:
+            if errors is None:
+                row, errors = clean_row(row)
+            if errors:
+                self.result.add_error(line_number, errors)
+            else:
+                rows.append((line_number, row))
+        if not rows:
+            return
+
+        # Ids resolved inside a rolled back batch must not outlive it
+        categories, attributes = dict(self.categories), dict(self.attributes)
+        try:
+            with transaction.atomic(), batched_product_changes() as changes:
+                rows = self.resolve_categories(rows)
+                self.resolve_attributes(rows)
+                self.write(rows, changes)
+        except DatabaseError as exc:
+            self.categories, self.attributes = categories, attributes
+            for line_number, _ in rows:
+                self.result.add_error(line_number, {'row': f'Database error: {exc}'})
+            return
+        self.result.created += len(rows)
+
+    def resolve_categories(self, rows):
+        missing = {row['category'] for _, row in rows} - self.categories.keys()
+        if missing:
+            found = Category.objects.filter(name__in=missing).values_list('name', 'id')
+            self.categories.update(found)
+            missing -= self.categories.keys()
+        if missing and self.create_categories:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            for name in missing:
+                cache.invalidate_category(self.categories[name])
+
+        resolved = []
+        for line_number, row in rows:
+            if row['category'] in self.categories:
+                resolved.append((line_number, row))
+            else:
+                self.result.add_error(line_number, {'category': f'Unknown category "{row["category"]}".'})
+        return resolved
+
+    def resolve_attributes(self, rows):
+        missing = {name for _, row in rows for name in row['attributes']} - self.attributes.keys()
+        if missing:
+            attributes, created = ProductAttribute.objects.get_or_create_many(sorted(missing))
+            self.attributes.update((name, attribute.id) for name, attribute in attributes.items())
+            if created:
+                cache.invalidate_attributes()
+
+    def write(self, rows, changes):
+        products = Product.objects.bulk_create([
+            Product(
+                name=row['name'],
+                description=row['description'],
+                price=row['price'],
+                category_obj_id=self.categories[row['category']],
+            )
+            for _, row in rows
+        ])
+        items, images = [], []
+        for product, (_, row) in zip(products, rows):
+            items.extend(
+                ProductAttributeItem(product_id=product.id, attribute_id=self.attributes[name], value=value)
+                for name, value in row['attributes'].items()
+            )
+            images.extend(
+                ProductImage(product_id=product.id, image=path, order=order)
+                for order, path in enumerate(row['images'])
+            )
+            changes.add(product.id, product.category_obj_id, reindex=True)
+        changes.add_facets(
+            {product.category_obj_id for product in products},
+            {(item.attribute_id, item.value) for item in items},
+        )
+        ProductAttributeItem.objects.bulk_create(items, batch_size=self.batch_size)
+        images = ProductImage.objects.bulk_create(images, batch_size=self.batch_size)
+        imaging.schedule(image.id for image in images)
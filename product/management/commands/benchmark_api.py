@@ -0,0 +1,277 @@
+import http.client
+import json
+import random
+import re
+import statistics
+import time
+import tracemalloc
+from contextlib import nullcontext
+from unittest import mock
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from product import synthetic
+from product.benchmarking import compare_results, format_table, percentiles, rolled_back
+from product.models import Category, Product, ProductAttribute, ProductAttributeItem
+from product.views import ProductViewSet
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The metrics middleware reports the queries of every response (ravvio/metrics.py)
+QUERIES_RE = re.compile(r'desc="(\d+) quer')
+WRITES = {'update-attributes', 'attribute-bulk-create'}
+SAMPLE_SIZE = 200
+
+
+class Catalog:
+    """Ids and values of the benchmarked catalog that the scenarios draw their requests from."""
+
+    def __init__(self, prefix, seed):
+        self.prefix = prefix
+        rng = random.Random(seed)
+        categories = Category.objects.filter(name__startswith=f'{prefix} ')
+        self.category_ids = list(categories.order_by('pk').values_list('pk', flat=True))
+        products = Product.objects.filter(category_obj__in=categories)
+        self.product_count = products.count()
+        ids = products.order_by('pk').values_list('pk', flat=True)
+        first, last = ids.first(), ids.last()
+        self.product_ids = []
+        if first is not None:
+            # The products at random points of the id range, each found through the primary key
+            picks = {rng.randint(first, last) for _ in range(SAMPLE_SIZE)}
+            self.product_ids = sorted({ids.filter(pk__gte=pick).first() for pick in picks})
+        self.items = {}
+        for item_id, product_id, attribute_id, value in ProductAttributeItem.objects.filter(
+            product_id__in=self.product_ids
+        ).order_by('pk').values_list('pk', 'product_id', 'attribute_id', 'value'):
+            self.items.setdefault(product_id, []).append((item_id, attribute_id, value))
+        self.attribute_values = list(
+            ProductAttributeItem.objects.filter(product_id__in=self.product_ids)
+            .order_by('attribute__name', 'value')
+            .values_list('product__category_obj_id', 'attribute__name', 'value')
+            .distinct()
+        )
+        self.attribute_names = list(
+            ProductAttribute.objects.filter(name__startswith=f'{prefix} ').order_by('pk').values_list('name', flat=True)
+        )
+
+
+def list_url(**params):
+    return f'/api/products/?{urlencode(params)}' if params else '/api/products/'
+
+
+def filtered_by_attribute(catalog, rng):
+    category_id, name, value = rng.choice(catalog.attribute_values)
+    return 'GET', list_url(category_obj=category_id, **{f'attr[{name}]': value}), None
+
+
+def update_attributes(catalog, rng):
+    product_id = rng.choice(catalog.product_ids)
+    items = catalog.items.get(product_id, [])
+    payload = [
+        {'id': item_id, 'value': f'{rng.randint(1, 64)}GB'}
+        for item_id, _, _ in rng.sample(items, min(2, len(items)))
+    ]
+    payload.append({'attribute_name_new': f'{catalog.prefix} attribute extra {rng.randint(0, 9)}', 'value': 'yes'})
+    return 'POST', f'/api/products/{product_id}/update_attributes/', {'attributes': payload}
+
+
+def bulk_create_attributes(catalog, rng):
+    # Half of the names exist already
+    names = rng.sample(catalog.attribute_names, min(5, len(catalog.attribute_names)))
+    names += [f'{catalog.prefix} attribute new {rng.randrange(10 ** 9)}' for _ in range(5)]
+    return 'POST', '/api/attributes/bulk_create/', {'names': names}
+
+
+# {name: function(catalog, rng) -> (method, path, JSON payload)}
+SCENARIOS = {
+    'list': lambda catalog, rng: ('GET', list_url(), None),
+    'list-page-size': lambda catalog, rng: ('GET', list_url(page_size=100), None),
+    'list-search': lambda catalog, rng: ('GET', list_url(search=rng.choice(synthetic.NOUNS)), None),
+    'list-category': lambda catalog, rng: ('GET', list_url(category_obj=rng.choice(catalog.category_ids)), None),
+    'list-attribute': filtered_by_attribute,
+    'list-ordering': lambda catalog, rng: ('GET', list_url(ordering=rng.choice(['price', '-price', 'name'])), None),
+    'list-search-ordering': lambda catalog, rng: (
+        'GET', list_url(search=rng.choice(synthetic.ADJECTIVES), ordering='-price', page_size=50), None
+    ),
+    'retrieve': lambda catalog, rng: ('GET', f'/api/products/{rng.choice(catalog.product_ids)}/', None),
+    'update-attributes': update_attributes,
+    'attribute-bulk-create': bulk_create_attributes,
+}
+
+
+class TestClientTransport:
+    def __init__(self):
+        self.client = Client(HTTP_HOST='localhost')
+
+    def request(self, method, path, payload):
+        if method == 'GET':
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, json.dumps(payload), content_type='application/json')
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class ServerTransport:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        # One keep-alive connection, like a browser or an API client
+        self.connection = connection_class(parts.netloc, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, payload):
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.connection.request(method, self.prefix + path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status, response.headers.get('Server-Timing', '')
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the product API with the requests of each scenario and report p50/p95/p99 latency, "
+        "queries and allocated memory per request, optionally against a saved baseline. Runs against "
+        "the synthetic catalog with --prefix (see generate_catalog); when there is none, one of "
+        "--products is generated in a transaction that is rolled back at the end, as are all writes. "
+        "With --url the requests go to a running server instead (gunicorn or the like, runserver "
+        "adds tens of milliseconds per response), which must use the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='Synthetic')
+        parser.add_argument('--products', type=int, default=2000, help='Products of a throwaway catalog')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only these (repeatable)')
+        parser.add_argument('--repeat', type=int, default=100, help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument('--memory-samples', type=int, default=5, help='Requests traced for memory per scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the response cache on; by default the rendering of every request is timed',
+        )
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument(
+            '--writes', action='store_true', help='Send the write scenarios to --url too (they persist)'
+        )
+        parser.add_argument('--save', metavar='PATH', help='Write the results to PATH as a baseline')
+        parser.add_argument('--baseline', metavar='PATH', help='Compare with the results saved in PATH')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Fail when a p95 is more than this fraction above the baseline (default 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        if options['url']:
+            if not Category.objects.filter(name__startswith=f"{options['prefix']} ").exists():
+                raise CommandError(f"No catalog with the prefix \"{options['prefix']}\"; run generate_catalog first.")
+            if not options['writes']:
+                scenarios = [name for name in scenarios if name not in WRITES]
+            catalog = Catalog(options['prefix'], options['seed'])
+            results = self.run(ServerTransport(options['url']), catalog, scenarios, options)
+        else:
+            # Versioned caching would answer repeated requests from the cache; time the rendering instead
+            uncached = mock.patch.object(ProductViewSet, 'cached_actions', ())
+            with rolled_back(), nullcontext() if options['with_cache'] else uncached:
+                if not Category.objects.filter(name__startswith=f"{options['prefix']} ").exists():
+                    synthetic.generate_catalog(options['products'], prefix=options['prefix'], seed=options['seed'])
+                catalog = Catalog(options['prefix'], options['seed'])
+                results = self.run(TestClientTransport(), catalog, scenarios, options)
+
+        meta = {
+            'mode': 'server' if options['url'] else 'client',
+            'database': connection.vendor,
+            'products': catalog.product_count,
+            'repeat': options['repeat'],
+            # A server's response cache cannot be turned off from here
+            'response_cache': options['with_cache'] or bool(options['url']),
+        }
+        if resource is not None:
+            # KiB on Linux
+            meta['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        self.stdout.write(format_table(
+            ['scenario', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'max queries', 'peak KiB'],
+            [
+                [name, stats['requests'], stats['errors'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                 stats['queries'], stats['max_queries'], stats['peak_kib']]
+                for name, stats in results.items()
+            ],
+        ))
+        self.stdout.write(f"\n{', '.join(f'{key}: {value}' for key, value in meta.items())}")
+        if any(stats['errors'] for stats in results.values()):
+            self.stderr.write(self.style.WARNING('Some requests failed; see the errors column.'))
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({'meta': meta, 'results': results}, file, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved the results to {options['save']}.")
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            self.stdout.write('')
+            differences = [
+                f'{key}: {baseline["meta"].get(key)} -> {value}'
+                for key, value in meta.items()
+                if key != 'max_rss_kib' and baseline['meta'].get(key) != value
+            ]
+            if differences:
+                self.stderr.write(self.style.WARNING(
+                    f"The baseline was measured differently ({'; '.join(differences)})."
+                ))
+            rows, regressions = compare_results(baseline['results'], results, options['tolerance'])
+            self.stdout.write(format_table(
+                ['scenario', 'base p50 ms', 'p50 ms', 'change', 'base p95 ms', 'p95 ms', 'change',
+                 'base queries', 'queries'],
+                rows,
+            ))
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def run(self, transport, catalog, scenarios, options):
+        results = {}
+        for name in scenarios:
+            # Every scenario sends the same requests on every run
+            rng = random.Random(f"{options['seed']}-{name}")
+            requests = [SCENARIOS[name](catalog, rng) for _ in range(options['warmup'] + options['repeat'])]
+            for request in requests[:options['warmup']]:
+                transport.request(*request)
+
+            timings, queries, errors = [], [], 0
+            for request in requests[options['warmup']:]:
+                start = time.perf_counter()
+                status, server_timing = transport.request(*request)
+                timings.append(time.perf_counter() - start)
+                match = QUERIES_RE.search(server_timing)
+                queries.append(int(match.group(1)) if match else 0)
+                errors += status >= 400
+
+            peaks = []
+            if isinstance(transport, TestClientTransport):
+                for request in requests[options['warmup']:][:options['memory_samples']]:
+                    tracemalloc.start()
+                    try:
+                        transport.request(*request)
+                        peaks.append(tracemalloc.get_traced_memory()[1])
+                    finally:
+                        tracemalloc.stop()
+
+            results[name] = {
+                'requests': len(timings),
+                'errors': errors,
+                **percentiles(timings),
+                'queries': statistics.median(queries),
+                'max_queries': max(queries),
+                'peak_kib': round(statistics.median(peaks) / 1024) if peaks else None,
+            }
+        return results
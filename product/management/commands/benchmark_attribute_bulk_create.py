@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from product.benchmarking import format_table, measure, rolled_back, summarize
+from product.models import ProductAttribute
+
+
+def legacy_bulk_create(names):
+    """The previous implementation: one get_or_create per name."""
+    return [ProductAttribute.objects.get_or_create(name=name)[0] for name in names]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare query count and latency of POST /api/attributes/bulk_create/ against the "
+        "previous per-name get_or_create loop. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--existing-ratio', type=float, default=0.5,
+            help="Share of the names that already exist before each run.",
+        )
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='localhost')
+        rows = []
+        for size in options['sizes']:
+            names = [f'bench-attribute-{size}-{i}' for i in range(size)]
+            existing = names[:int(size * options['existing_ratio'])]
+            # Clients often send duplicates when pasting spec sheets
+            payload = names + existing[:size // 10]
+
+            for label, run in [
+                ('get_or_create loop', lambda: legacy_bulk_create(payload)),
+                ('bulk_create endpoint', lambda: client.post(
+                    '/api/attributes/bulk_create/', {'names': payload}, content_type='application/json')),
+            ]:
+                timings, queries = [], 0
+                for _ in range(options['repeat']):
+                    with rolled_back():
+                        ProductAttribute.objects.bulk_create([ProductAttribute(name=name) for name in existing])
+                        elapsed, queries, _ = measure(run)
+                    timings.append(elapsed)
+                stats = summarize(timings)
+                rows.append([size, label, queries, stats['median_ms'], stats['min_ms']])
+
+        self.stdout.write(format_table(['names', 'path', 'queries', 'median ms', 'min ms'], rows))
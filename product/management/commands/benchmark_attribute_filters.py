@@ -0,0 +1,97 @@
+import random
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from product.benchmarking import format_table, measure, rolled_back, summarize
+from product.models import Category, Product, ProductAttribute, ProductAttributeItem
+from product.views import ProductViewSet
+
+ATTRIBUTE_VALUES = {
+    'bench-RAM': ['4GB', '8GB', '16GB', '32GB', '64GB'],
+    'bench-Storage': ['128GB', '256GB', '512GB', '1024GB', '2048GB'],
+    'bench-Color': ['Black', 'White', 'Silver', 'Blue', 'Red', 'Green', 'Gold', 'Grey'],
+    'bench-Weight': [f'{weight / 10} kg' for weight in range(5, 40)],
+}
+COMPOSITE_INDEXES = ['attribute_item_value_idx', 'attribute_item_numeric_idx']
+
+
+def create_items(rows, attributes_per_product, batch_size, log):
+    category = Category.objects.create(name='bench-attribute-filters')
+    attributes = [ProductAttribute.objects.create(name=name) for name in ATTRIBUTE_VALUES]
+    # Pad products with further attributes so the table holds `rows` items
+    attributes += [
+        ProductAttribute.objects.create(name=f'bench-spec-{i}')
+        for i in range(max(0, attributes_per_product - len(attributes)))
+    ]
+    attributes = attributes[:attributes_per_product]
+    rng = random.Random(42)
+    product_count = rows // len(attributes)
+    for start in range(0, product_count, batch_size):
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', description='', price=i, category_obj=category)
+            for i in range(start, min(start + batch_size, product_count))
+        ])
+        ProductAttributeItem.objects.bulk_create([
+            ProductAttributeItem(
+                product=product,
+                attribute=attribute,
+                value=rng.choice(ATTRIBUTE_VALUES.get(attribute.name, [str(rng.randrange(1000))])),
+            )
+            for product in products
+            for attribute in attributes
+        ], batch_size=5000)
+        log(f"{start + len(products)} / {product_count} products")
+    return category
+
+
+class Command(BaseCommand):
+    help = (
+        "Time ?attr[...] filters on the product list over a catalog with `--rows` attribute items, "
+        "with and without the composite indexes. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--attributes-per-product', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='localhost')
+        queries = [
+            ('one value', {'attr[bench-RAM]': '16GB'}),
+            ('two attributes', {'attr[bench-RAM]': '16GB', 'attr[bench-Color]': 'Red'}),
+            ('several values', {'attr[bench-Color]': 'Red,Blue,Green', 'attr[bench-Storage]': '512GB'}),
+            ('numeric range', {'attr[bench-RAM]': '16..64', 'attr[bench-Weight]': '..1.2'}),
+        ]
+        rows = []
+        with rolled_back(), mock.patch.object(ProductViewSet, 'cached_actions', ()):
+            log = self.stdout.write if options['verbosity'] > 1 else lambda message: None
+            create_items(options['rows'], options['attributes_per_product'], options['batch_size'], log)
+            with connection.cursor() as cursor:
+                # Fresh statistics, as a production database would have them
+                cursor.execute('ANALYZE' if connection.vendor in ('sqlite', 'postgresql') else 'SELECT 1')
+            total = ProductAttributeItem.objects.count()
+
+            for label in ['composite indexes', 'without them']:
+                if label == 'without them':
+                    with connection.cursor() as cursor:
+                        for name in COMPOSITE_INDEXES:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                for query, params in queries:
+                    timings = []
+                    for _ in range(options['repeat']):
+                        elapsed, query_count, response = measure(
+                            lambda: client.get('/api/products/', {**params, 'page_size': 20})
+                        )
+                        timings.append(elapsed)
+                    stats = summarize(timings)
+                    rows.append([
+                        label, query, response.json()['count'], query_count, stats['median_ms'], stats['min_ms'],
+                    ])
+
+        self.stdout.write(f"{total} attribute items")
+        self.stdout.write(format_table(['schema', 'filter', 'matches', 'queries', 'median ms', 'min ms'], rows))
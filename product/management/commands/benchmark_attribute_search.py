@@ -0,0 +1,61 @@
+import random
+import string
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from product import cache
+from product.benchmarking import format_table, measure, rolled_back, summarize
+from product.models import ProductAttribute
+
+WORDS = ['screen', 'size', 'color', 'weight', 'battery', 'memory', 'storage', 'port', 'cable', 'power']
+
+
+def legacy_search_or_create(query):
+    """The previous implementation: icontains, exists() and a second evaluation."""
+    attributes = ProductAttribute.objects.filter(name__icontains=query)
+    if not attributes.exists():
+        return []
+    return list(attributes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time GET /api/attributes/search_or_create/ against the previous icontains lookup "
+        "with `--names` attribute names. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='localhost')
+        rng = random.Random(42)
+        queries = ['s', 'scr', 'screen si', 'pow', 'zq']
+        rows = []
+        with rolled_back():
+            names = {
+                f"{rng.choice(WORDS).title()} {''.join(rng.choices(string.ascii_lowercase, k=6))} {i}"
+                for i in range(options['names'])
+            }
+            ProductAttribute.objects.bulk_create([ProductAttribute(name=name) for name in names], batch_size=5000)
+            # bulk_create sends no signals; the index must see the new names
+            cache.bump_versions(cache.ATTRIBUTES)
+            elapsed, _, _ = measure(lambda: client.get('/api/attributes/search_or_create/', {'name': 'warm'}))
+            self.stdout.write(f"{len(names)} names, index built in {elapsed * 1000:.1f} ms")
+
+            for query in queries:
+                for label, run in [
+                    ('icontains', lambda: legacy_search_or_create(query)),
+                    ('typeahead', lambda: client.get('/api/attributes/search_or_create/', {'name': query})),
+                ]:
+                    timings = []
+                    for _ in range(options['repeat']):
+                        elapsed, queries_run, result = measure(run)
+                        timings.append(elapsed)
+                    matches = len(result) if isinstance(result, list) else len(result.json())
+                    stats = summarize(timings)
+                    rows.append([query, label, queries_run, matches, stats['median_ms'], stats['max_ms']])
+
+        self.stdout.write(format_table(['query', 'path', 'queries', 'results', 'median ms', 'max ms'], rows))
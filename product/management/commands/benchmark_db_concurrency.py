@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections, transaction
+from django.test.utils import override_settings
+
+from product.benchmarking import format_table, summarize
+from product.models import Category, Product, ProductAttribute, ProductAttributeItem
+from product.signals import batched_product_changes
+from ravvio.db import SQLITE_ENGINE, sqlite_pragmas, sqlite_transaction_mode
+
+ALIAS = 'benchmark'
+
+
+class Worker(threading.Thread):
+    def __init__(self, operation, deadline):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.deadline = deadline
+        self.timings = []
+        self.errors = 0
+
+    def run(self):
+        try:
+            while time.perf_counter() < self.deadline:
+                start = time.perf_counter()
+                try:
+                    self.operation()
+                except OperationalError:
+                    # "database is locked"
+                    self.errors += 1
+                else:
+                    self.timings.append(time.perf_counter() - start)
+                # End of a request: connections older than CONN_MAX_AGE are closed
+                close_old_connections()
+        finally:
+            connections.close_all()
+
+
+def read_page(category_id):
+    list(Product.objects.using(ALIAS).filter(category_obj_id=category_id).with_related().order_by('-id')[:20])
+
+
+def write_product(category_id, attribute_id):
+    # bulk_create sends no signals, whose follow-up work would go to the default database
+    with transaction.atomic(using=ALIAS):
+        # Read before writing, as the import and admin paths do
+        Category.objects.using(ALIAS).filter(pk=category_id).exists()
+        product, = Product.objects.using(ALIAS).bulk_create([
+            Product(name='Concurrent product', description='', price=1, category_obj_id=category_id)
+        ])
+        ProductAttributeItem.objects.using(ALIAS).bulk_create([
+            ProductAttributeItem(product=product, attribute_id=attribute_id, value=str(i)) for i in range(5)
+        ])
+        Product.objects.using(ALIAS).filter(pk=product.pk).touch()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure reader and writer throughput with concurrent threads. On SQLite each mode runs on "
+        "a scratch copy of the schema; on PostgreSQL, rows are written to the configured database "
+        "under a throwaway category and removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--seed-products', type=int, default=500)
+
+    def handle(self, *args, **options):
+        default = settings.DATABASES['default']
+        if default['ENGINE'] == SQLITE_ENGINE:
+            modes = [
+                ('sqlite default', {}, 'default'),
+                ('sqlite tuned', {}, 'tuned'),
+                ('sqlite wal', {}, 'wal'),
+            ]
+        elif default['ENGINE'] == 'django.db.backends.postgresql':
+            modes = [
+                ('postgres, connect per request', {'CONN_MAX_AGE': 0}, None),
+                ('postgres, persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}, None),
+            ]
+        else:
+            raise CommandError(f"Unsupported engine {default['ENGINE']}")
+
+        rows = []
+        for label, overrides, sqlite_mode in modes:
+            with tempfile.TemporaryDirectory() as directory:
+                database = {**default, **overrides}
+                if default['ENGINE'] == SQLITE_ENGINE:
+                    database['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+                with override_settings(
+                    SQLITE_PRAGMAS=sqlite_pragmas(sqlite_mode),
+                    SQLITE_TRANSACTION_MODE=sqlite_transaction_mode(sqlite_mode),
+                ):
+                    rows.extend(self.run_mode(label, database, options))
+        self.stdout.write(format_table(
+            ['mode', 'role', 'threads', 'ops/s', 'median ms', 'max ms', 'locked errors'], rows
+        ))
+
+    def run_mode(self, label, database, options):
+        connections.databases[ALIAS] = database
+        try:
+            if database['ENGINE'] == SQLITE_ENGINE:
+                call_command('migrate', database=ALIAS, verbosity=0)
+            category, = Category.objects.using(ALIAS).bulk_create([
+                Category(name=f'benchmark-concurrency-{time.time_ns()}')
+            ])
+            attribute, = ProductAttribute.objects.using(ALIAS).bulk_create([
+                ProductAttribute(name=f'benchmark-concurrency-{time.time_ns()}')
+            ])
+            Product.objects.using(ALIAS).bulk_create([
+                Product(name=f'Product {i}', description='', price=i, category_obj=category)
+                for i in range(options['seed_products'])
+            ])
+            connections[ALIAS].close()
+
+            deadline = time.perf_counter() + options['seconds']
+            readers = [Worker(lambda: read_page(category.id), deadline) for _ in range(options['readers'])]
+            writers = [
+                Worker(lambda: write_product(category.id, attribute.id), deadline) for _ in range(options['writers'])
+            ]
+            for worker in readers + writers:
+                worker.start()
+            for worker in readers + writers:
+                worker.join()
+
+            if database['ENGINE'] != SQLITE_ENGINE:
+                # The same database as default here, so the follow-up work of the signals applies
+                with transaction.atomic(using=ALIAS), batched_product_changes():
+                    Category.objects.using(ALIAS).filter(pk=category.pk).delete()
+                    ProductAttribute.objects.using(ALIAS).filter(pk=attribute.pk).delete()
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.databases[ALIAS]
+
+        results = []
+        for role, workers in [('readers', readers), ('writers', writers)]:
+            timings = [timing for worker in workers for timing in worker.timings]
+            stats = summarize(timings) if timings else {'median_ms': '-', 'max_ms': '-'}
+            results.append([
+                label, role, len(workers), round(len(timings) / options['seconds'], 1),
+                stats['median_ms'], stats['max_ms'], sum(worker.errors for worker in workers),
+            ])
+        return results
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from product.benchmarking import format_table, measure, rolled_back, summarize
+from product.models import Category, Product, ProductAttribute, ProductAttributeItem, ProductImage
+from product.views import ProductViewSet
+
+
+def create_products(count, attributes_per_product, images_per_product):
+    category = Category.objects.create(name='bench-read-path')
+    attributes = [ProductAttribute.objects.create(name=f'bench-read-path-{i}') for i in range(attributes_per_product)]
+    products = Product.objects.bulk_create([
+        Product(name=f'Product {i}', description='A benchmark product ' * 10, price=i, category_obj=category)
+        for i in range(count)
+    ])
+    ProductAttributeItem.objects.bulk_create([
+        ProductAttributeItem(product=product, attribute=attribute, value=f'value {i}')
+        for product in products
+        for i, attribute in enumerate(attributes)
+    ])
+    variants = {
+        size: {'jpeg': f'product_images/variants/bench_{size}.jpg', 'webp': f'product_images/variants/bench_{size}.webp'}
+        for size in ('thumb', 'medium', 'large')
+    }
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'product_images/bench_{product.id}_{i}.jpg', order=i, variants=variants)
+        for product in products
+        for i in range(images_per_product)
+    ])
+    return category
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the serializer and the .values() read path on GET /api/products/ and "
+        "/api/products/<id>/. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--attributes', type=int, default=8)
+        parser.add_argument('--images', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Versioned caching would answer every repeat from the cache; time the rendering instead
+        client = Client(HTTP_HOST='localhost')
+        rows = []
+        with rolled_back(), mock.patch.object(ProductViewSet, 'cached_actions', ()):
+            category = create_products(options['products'], options['attributes'], options['images'])
+            product_id = category.product_set.values_list('id', flat=True).first()
+            list_url = f"/api/products/?category_obj={category.id}&page_size={options['products']}"
+
+            for endpoint, url in [('list', list_url), ('detail', f'/api/products/{product_id}/')]:
+                results = {}
+                for label, actions in [('serializer', ()), ('values reader', ('list', 'retrieve'))]:
+                    with mock.patch.object(ProductViewSet, 'fast_read_actions', actions):
+                        client.get(url)  # warm up
+                        timings = []
+                        for _ in range(options['repeat']):
+                            elapsed, queries, response = measure(lambda: client.get(url))
+                            timings.append(elapsed)
+                    stats = summarize(timings)
+                    results[label] = response.content
+                    rows.append([
+                        endpoint, label, queries, stats['median_ms'], stats['min_ms'],
+                        round(1000 / stats['median_ms'], 1), len(response.content),
+                    ])
+                if results['serializer'] != results['values reader']:
+                    self.stderr.write(self.style.ERROR(f"{endpoint}: responses differ"))
+
+        self.stdout.write(format_table(
+            ['endpoint', 'path', 'queries', 'median ms', 'min ms', 'req/s', 'bytes'], rows
+        ))
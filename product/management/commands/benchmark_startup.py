@@ -0,0 +1,148 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from product.benchmarking import format_table
+
+# Runs in a fresh interpreter: boot the WSGI application, then time two requests
+CHILD = '''
+import json, sys, time
+from io import BytesIO
+
+start = time.perf_counter()
+from ravvio.wsgi import application
+booted = time.perf_counter()
+
+
+def call(path):
+    status = []
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    }
+    response = application(environ, lambda value, headers: status.append(value))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return status[0]
+
+
+status = call(sys.argv[1])
+first = time.perf_counter()
+call(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({
+    'boot': booted - start, 'first': first - booted, 'second': second - first,
+    'status': status, 'modules': len(sys.modules),
+}))
+'''
+
+PROFILES = {
+    'default': {},
+    'lean': {'DJANGO_LEAN_STARTUP': '1'},
+}
+
+
+def parse_import_times(stderr):
+    """{module: (self microseconds, cumulative microseconds)} from `python -X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold starts: boot ravvio.wsgi in fresh interpreters with the default and the lean "
+        "(DJANGO_LEAN_STARTUP) profiles and time the first and second response to --path, then list "
+        "where the import time of a start goes. Uses the configured database; --path should be a "
+        "GET that needs no authentication."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per profile')
+        parser.add_argument('--path', default='/api/categories/')
+        parser.add_argument('--top', type=int, default=15, help='Modules and packages to list')
+
+    def handle(self, *args, **options):
+        runs = defaultdict(list)
+        # Interleaved, so that drift in machine load hits every profile alike
+        for _ in range(options['runs']):
+            for profile, environ in PROFILES.items():
+                runs[profile].append(self.start(environ, options['path']))
+
+        rows = []
+        imports = {}
+        for profile in PROFILES:
+            imports[profile] = runs[profile][-1][1]
+            results = [result for result, _ in runs[profile]]
+
+            def median_ms(key):
+                return round(statistics.median(result[key] for result in results) * 1000, 1)
+
+            rows.append([
+                profile, results[0]['status'], results[0]['modules'], median_ms('boot'), median_ms('first'),
+                round(statistics.median(result['boot'] + result['first'] for result in results) * 1000, 1),
+                median_ms('second'),
+            ])
+
+        self.stdout.write(format_table(
+            ['profile', 'first status', 'modules', 'boot ms', 'first response ms', 'time to first response ms',
+             'second response ms'],
+            rows,
+        ))
+
+        self.stdout.write('')
+        packages = {}
+        for profile, times in imports.items():
+            totals = defaultdict(int)
+            for name, (self_us, _) in times.items():
+                totals[name.split('.')[0]] += self_us
+            packages[profile] = totals
+        top = sorted(packages['default'], key=packages['default'].get, reverse=True)[:options['top']]
+        self.stdout.write(format_table(
+            ['package', *(f'{profile} import ms' for profile in PROFILES)],
+            [[name, *(round(packages[profile].get(name, 0) / 1000, 1) for profile in PROFILES)] for name in top],
+        ))
+
+        self.stdout.write('')
+        times = imports['default']
+        top = sorted(times, key=lambda name: times[name][0], reverse=True)[:options['top']]
+        self.stdout.write(format_table(
+            ['module (default profile)', 'self ms', 'cumulative ms'],
+            [[name, round(times[name][0] / 1000, 1), round(times[name][1] / 1000, 1)] for name in top],
+        ))
+
+        if sys.flags.dont_write_bytecode or os.environ.get('PYTHONDONTWRITEBYTECODE'):
+            self.stdout.write(self.style.WARNING(
+                "\nPYTHONDONTWRITEBYTECODE is set: modules without up to date .pyc files are compiled "
+                "on every start. Deploy with `python -m compileall` instead."
+            ))
+
+    def start(self, environ, path):
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD, path],
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'ravvio.settings'),
+                'DJANGO_LEAN_STARTUP': '',
+                **environ,
+            },
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(f'The benchmark process failed:\n{process.stderr[-2000:]}')
+        return json.loads(process.stdout.strip().splitlines()[-1]), parse_import_times(process.stderr)
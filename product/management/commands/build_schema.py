@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ravvio import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema of the current code version into SCHEMA_CACHE_DIR, as YAML and "
+        "JSON with gzipped copies, so /api/schema/ never generates it in a worker. Run it on deploy."
+    )
+
+    def handle(self, *args, **options):
+        version = schema.code_version()
+        start = time.perf_counter()
+        schemas = schema.generate_schema()
+        elapsed = time.perf_counter() - start
+        paths = schema.write_schema(version, schemas)
+        if options['verbosity'] > 1:
+            for path in paths:
+                self.stdout.write(f'{path} ({path.stat().st_size} bytes)')
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated the schema of version {version} in {elapsed * 1000:.0f} ms, "
+            f"wrote {len(paths)} files to {schema.schema_directory(version)}."
+        ))
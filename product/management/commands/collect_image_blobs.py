@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.models import ProductImage
+from product.storage import delete_blob_if_unreferenced, is_blob_name
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed product image blobs that no ProductImage references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Only delete blobs older than this many seconds, so in-flight uploads are kept.",
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def iter_blobs(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for filename in files:
+            name = f'{directory}/{filename}'
+            if is_blob_name(name):
+                yield name
+        for subdirectory in directories:
+            if len(subdirectory) == 2:
+                yield from self.iter_blobs(storage, f'{directory}/{subdirectory}')
+
+    def handle(self, *args, **options):
+        field = ProductImage._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to
+        if not storage.exists(directory):
+            self.stdout.write("No blobs stored yet.")
+            return
+
+        cutoff = time.time() - options['min_age']
+        deleted = kept = 0
+        for name in self.iter_blobs(storage, directory):
+            if storage.get_modified_time(name).timestamp() > cutoff:
+                kept += 1
+                continue
+            if options['dry_run']:
+                unreferenced = not ProductImage.objects.filter(image=name).exists()
+            else:
+                unreferenced = delete_blob_if_unreferenced(storage, name)
+            if unreferenced:
+                deleted += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+            else:
+                kept += 1
+        action = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{action} {deleted} unreferenced blobs, kept {kept}."))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from product import exporters
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as JSONL or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exporters.FORMATS, default='jsonl')
+        parser.add_argument('--output', '-o', default='-', help="File to write, or - for standard output.")
+        parser.add_argument('--category', type=int, help="Only export products of this category id.")
+        parser.add_argument(
+            '--base-url', default='',
+            help="Prefix for image URLs, e.g. https://api.ravvio.net",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.order_by('id')
+        if options['category']:
+            queryset = queryset.filter(category_obj_id=options['category'])
+        base_url = options['base_url'].rstrip('/')
+        chunks = exporters.export(queryset, options['format'], build_url=lambda url: base_url + url)
+
+        if options['output'] == '-':
+            sys.stdout.writelines(chunks)
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(chunks)
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a deterministic synthetic catalog for benchmarks (see product/synthetic.py): the same "
+        "options always produce the same products. Point DATABASE_URL at a scratch database for the "
+        "100k and 1m scales."
+    )
+
+    def add_arguments(self, parser):
+        size = parser.add_mutually_exclusive_group(required=True)
+        size.add_argument('--scale', choices=synthetic.SCALES, help='Number of products: 10k, 100k or 1m')
+        size.add_argument('--products', type=int)
+        size.add_argument('--delete', action='store_true', help='Delete the catalog with --prefix and exit')
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--attributes', type=int, default=200, help='Distinct attribute names')
+        parser.add_argument('--attributes-per-product', type=int, default=8)
+        parser.add_argument('--images-per-product', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='Synthetic', help='Prefix of the category and attribute names')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Products per transaction')
+        parser.add_argument('--replace', action='store_true', help='Delete an existing catalog with --prefix first')
+
+    def handle(self, *args, **options):
+        if options['delete'] or options['replace']:
+            start = time.perf_counter()
+            deleted = synthetic.delete_catalog(options['prefix'], options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} products in {time.perf_counter() - start:.1f} s.")
+            if options['delete']:
+                return
+
+        products = synthetic.SCALES[options['scale']] if options['scale'] else options['products']
+
+        def progress(written):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{written}/{products} products')
+
+        start = time.perf_counter()
+        try:
+            counts = synthetic.generate_catalog(
+                products,
+                categories=options['categories'],
+                attributes=options['attributes'],
+                attributes_per_product=options['attributes_per_product'],
+                images_per_product=options['images_per_product'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(f'{exc} Use --replace, or another --prefix.')
+        elapsed = time.perf_counter() - start
+        rows = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {', '.join(f'{count} {name}' for name, count in counts.items())} "
+            f"in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from product import imaging
+from product.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Generate resized and re-encoded variants for product images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild every image's variants, even existing ones.",
+        )
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('id')
+        processed = skipped = failed = 0
+        for image in images.only('id', 'image', 'variants').iterator(chunk_size=500):
+            if not options['force'] and imaging.has_current_variants(image):
+                skipped += 1
+                continue
+            if options['verbosity'] > 1:
+                self.stdout.write(image.image.name)
+            if imaging.process_image(image.id, force=options['force']):
+                processed += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {processed} images, {skipped} up to date, {failed} failed."
+        ))
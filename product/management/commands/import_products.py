@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importers import FORMATS, ProductImporter, guess_format
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV or JSONL file, streaming it in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--no-create-categories', action='store_false', dest='create_categories',
+            help="Reject rows whose category does not exist instead of creating it.",
+        )
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or guess_format(path)
+        if format is None:
+            raise CommandError("Cannot tell the format from the file name; pass --format.")
+
+        importer = ProductImporter(
+            batch_size=options['batch_size'],
+            create_categories=options['create_categories'],
+        )
+        if path == '-':
+            result = importer.run(sys.stdin, format)
+        else:
+            with open(path, encoding=options['encoding'], newline='') as stream:
+                result = importer.run(stream, format)
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... {result.failed - len(result.errors)} more failed rows")
+        self.stdout.write(self.style.SUCCESS(f"Imported {result.created} products, {result.failed} failed."))
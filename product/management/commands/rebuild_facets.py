@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product import facets
+
+
+class Command(BaseCommand):
+    help = "Recount the category and attribute value facets of the catalog from scratch."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} facet counts."))
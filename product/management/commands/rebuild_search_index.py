@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of products from scratch."
+
+    def handle(self, *args, **options):
+        try:
+            count = search.rebuild_index()
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
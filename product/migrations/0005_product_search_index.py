@@ -0,0 +1,61 @@
+# Generated by Django 4.2.21 on 2026-10-16 21:01
+
+from django.db import migrations, models
+import django.db
+import django.db.models.deletion
+import product.models
+
+
+def create_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+            "name, description, attributes, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except django.db.OperationalError:
+        # SQLite built without FTS5: search keeps using icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO product_search (rowid, name, description, attributes) "
+        "SELECT p.id, p.name, p.description, COALESCE(("
+        "  SELECT group_concat(a.name || ' ' || i.value, ' ')"
+        "  FROM product_productattributeitem i"
+        "  INNER JOIN product_productattribute a ON a.id = i.attribute_id"
+        "  WHERE i.product_id = p.id"
+        "), '') FROM product_product p"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='product.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('attributes', models.TextField()),
+                ('document', product.models.SearchDocumentField(db_column='product_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'product_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
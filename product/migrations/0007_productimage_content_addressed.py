@@ -0,0 +1,19 @@
+# Generated by Django 4.2.21 on 2026-10-16 21:08
+
+from django.db import migrations, models
+import product.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(db_index=True, storage=product.storage.get_product_image_storage, upload_to='product_images'),
+        ),
+    ]
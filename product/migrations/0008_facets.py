@@ -0,0 +1,74 @@
+# Generated by Django 4.2.21 on 2026-10-16 21:14
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_facets(apps, schema_editor):
+    Category = apps.get_model('product', 'Category')
+    CategoryFacet = apps.get_model('product', 'CategoryFacet')
+    AttributeValueFacet = apps.get_model('product', 'AttributeValueFacet')
+    ProductAttributeItem = apps.get_model('product', 'ProductAttributeItem')
+
+    categories = Category.objects.annotate(product_count=Count('product')).values_list('id', 'product_count')
+    CategoryFacet.objects.bulk_create(
+        [CategoryFacet(category_id=pk, product_count=count) for pk, count in categories.iterator()],
+        batch_size=1000,
+    )
+    values = (
+        ProductAttributeItem.objects.order_by()
+        .values_list('product__category_obj_id', 'attribute_id', 'value')
+        .annotate(Count('product_id', distinct=True))
+    )
+    AttributeValueFacet.objects.bulk_create(
+        (
+            AttributeValueFacet(category_id=category_id, attribute_id=attribute_id, value=value, product_count=count)
+            for category_id, attribute_id, value, count in values.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_productimage_content_addressed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeValueFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=255)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='facet', serialize=False, to='product.category')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productattributeitem',
+            index=models.Index(fields=['attribute', 'value'], name='attribute_item_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='attributevaluefacet',
+            name='attribute',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.productattribute'),
+        ),
+        migrations.AddField(
+            model_name='attributevaluefacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='attributevaluefacet',
+            constraint=models.UniqueConstraint(fields=('attribute', 'value', 'category'), name='attribute_value_facet_unique'),
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
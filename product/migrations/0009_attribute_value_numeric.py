@@ -0,0 +1,59 @@
+# Generated by Django 4.2.21 on 2026-10-16 21:16
+
+import math
+import re
+
+from django.db import migrations, models
+
+NUMERIC_PREFIX_RE = re.compile(r'^\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))')
+
+
+def parse_numeric(value):
+    # product.models.parse_numeric as of this migration
+    match = NUMERIC_PREFIX_RE.match(value or '')
+    if match is None:
+        return None
+    number = float(match.group(1))
+    return number if math.isfinite(number) else None
+
+
+def fill_value_numeric(apps, schema_editor):
+    ProductAttributeItem = apps.get_model('product', 'ProductAttributeItem')
+    batch = []
+    for item in ProductAttributeItem.objects.only('id', 'value').iterator(chunk_size=2000):
+        item.value_numeric = parse_numeric(item.value)
+        if item.value_numeric is not None:
+            batch.append(item)
+        if len(batch) >= 2000:
+            ProductAttributeItem.objects.bulk_update(batch, ['value_numeric'])
+            batch = []
+    ProductAttributeItem.objects.bulk_update(batch, ['value_numeric'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_facets'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productattributeitem',
+            name='attribute_item_value_idx',
+        ),
+        migrations.AddField(
+            model_name='productattributeitem',
+            name='value_numeric',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        # Before the numeric index exists, so filling it does not maintain the index row by row
+        migrations.RunPython(fill_value_numeric, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productattributeitem',
+            index=models.Index(fields=['attribute', 'value', 'product'], name='attribute_item_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productattributeitem',
+            index=models.Index(fields=['attribute', 'value_numeric', 'product'], name='attribute_item_numeric_idx'),
+        ),
+    ]
@@ -1,45 +1,283 @@
-from django.db import models
+import math
+import re
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .storage import get_product_image_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
     
 
+class ProductQuerySet(models.QuerySet):
+    def touch(self):
+        """Mark products as modified after changes to their attributes or images."""
+        return self.update(updated_at=timezone.now())
+
+    def with_related(self, fields=None):
+        """
+        Load everything ProductSerializer nests in a constant number of queries.
+
+        `fields` limits this to the nested serializer fields actually rendered;
+        by default category, attributes and images are loaded.
+        """
+        fields = {'category', 'attributes', 'images'} if fields is None else set(fields)
+        queryset = self.select_related('category_obj') if 'category' in fields else self
+        lookups = []
+        if 'attributes' in fields:
+            lookups.append(models.Prefetch(
+                'attributes',
+                queryset=ProductAttributeItem.objects.select_related('attribute').order_by('id'),
+            ))
+        if 'images' in fields:
+            lookups.append(models.Prefetch(
+                'images',
+                queryset=ProductImage.objects.order_by('order', 'id'),
+            ))
+        if 'primary_image' in fields:
+            # A sliced prefetch loads one image per product, not the whole gallery
+            lookups.append(models.Prefetch(
+                'images',
+                queryset=ProductImage.objects.order_by('order', 'id')[:1],
+                to_attr='primary_images',
+            ))
+        return queryset.prefetch_related(*lookups)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.FloatField(null=True, blank=True)
     category_obj = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name='Category')
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Seek indexes for keyset pagination over the catalog orderings
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ]
+
+    # Category as loaded from the database, so a move can invalidate both sides
+    _loaded_category_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_obj_id')
+        return instance
+
+    @property
+    def primary_image(self):
+        """The first image in display order, or None."""
+        if hasattr(self, 'primary_images'):
+            return self.primary_images[0] if self.primary_images else None
+        return self.images.order_by('order', 'id').first()
+
     def __str__(self):
         return self.name
 
 
+class ProductAttributeQuerySet(models.QuerySet):
+    def get_or_create_many(self, names):
+        """
+        Set-based get_or_create by name.
+
+        Returns a dict of name -> ProductAttribute for every distinct name and the
+        list of names that were missing and have been inserted. Costs three
+        queries however many names are given.
+        """
+        names = list(dict.fromkeys(names))
+        existing = set(self.filter(name__in=names).values_list('name', flat=True))
+        created = [name for name in names if name not in existing]
+        if created:
+            # A concurrent writer inserting the same name is not an error
+            self.bulk_create([self.model(name=name) for name in created], ignore_conflicts=True)
+        attributes = {attribute.name: attribute for attribute in self.filter(name__in=names)}
+        return attributes, created
+
+
 class ProductAttribute(models.Model):
-    name = models.CharField(max_length=100, unique=True)    
+    name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductAttributeQuerySet.as_manager()
 
     def __str__(self):
         return self.name
     
 
+NUMERIC_PREFIX_RE = re.compile(r'^\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))')
+
+
+def parse_numeric(value):
+    """The number a value such as "16GB", "15.6 in" or "-5" starts with, or None."""
+    match = NUMERIC_PREFIX_RE.match(value or '')
+    if match is None:
+        return None
+    number = float(match.group(1))
+    return number if math.isfinite(number) else None
+
+
+class ProductAttributeItemQuerySet(models.QuerySet):
+    """Keeps `value_numeric` in step with `value` on the bulk paths, which bypass save()."""
+
+    def update(self, **kwargs):
+        if 'value' not in kwargs or 'value_numeric' in kwargs:
+            return super().update(**kwargs)
+        if isinstance(kwargs['value'], str):
+            return super().update(**kwargs, value_numeric=parse_numeric(kwargs['value']))
+        # An expression: parse the values it produced
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            updated = super().update(**kwargs)
+            items = list(self.model._base_manager.using(self.db).filter(pk__in=pks).only('id', 'value'))
+            for item in items:
+                item.value_numeric = parse_numeric(item.value)
+            self.model.objects.using(self.db).bulk_update(items, ['value_numeric'], batch_size=2000)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.value_numeric = parse_numeric(obj.value)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if 'value' in fields:
+            for obj in objs:
+                obj.value_numeric = parse_numeric(obj.value)
+            fields.append('value_numeric')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class ProductAttributeItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='attributes')
     attribute = models.ForeignKey(ProductAttribute, on_delete=models.CASCADE, verbose_name="Specification")
     value = models.CharField(max_length=255)
+    # Leading number of `value`, for range filters such as ?attr[RAM]=8..32
+    value_numeric = models.FloatField(null=True, blank=True, editable=False)
+
+    objects = ProductAttributeItemQuerySet.as_manager()
+
+    class Meta:
+        # Attribute filters and facet recounts are index-only range scans
+        indexes = [
+            models.Index(fields=['attribute', 'value', 'product'], name='attribute_item_value_idx'),
+            models.Index(fields=['attribute', 'value_numeric', 'product'], name='attribute_item_numeric_idx'),
+        ]
+
+    # Attribute value as loaded from the database, so a change can recount both facets
+    _loaded_attribute_id = None
+    _loaded_value = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_attribute_id = instance.__dict__.get('attribute_id')
+        instance._loaded_value = instance.__dict__.get('value')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.value_numeric = parse_numeric(self.value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'value_numeric'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.attribute}: {self.value}"
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='product_images')
+    # Content-addressed: identical uploads share one file, counted by this indexed column
+    image = models.ImageField(upload_to='product_images', storage=get_product_image_storage, db_index=True)
     order = models.IntegerField(default=0)  # For controlling display order
     caption = models.CharField(max_length=200, blank=True)
+    # Resized encodings written by product.imaging: {variant: {encoding: name}}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['order']
 
+    # File as loaded from the database, so replacing it can release the old blob
+    _loaded_image_name = None
+    _loaded_variants = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image_name = instance.__dict__.get('image')
+        instance._loaded_variants = instance.__dict__.get('variants')
+        return instance
+
     def __str__(self):
-        return f"Image for {self.product.name}"
\ No newline at end of file
+        return f"Image for {self.product.name}"
+
+
+class CategoryFacet(models.Model):
+    """Number of products in a category, kept up to date by product.facets."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='facet')
+    product_count = models.PositiveIntegerField(default=0)
+
+
+class AttributeValueFacet(models.Model):
+    """Number of products of a category carrying an attribute value, kept up to date by product.facets."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    attribute = models.ForeignKey(ProductAttribute, on_delete=models.CASCADE, related_name='+')
+    value = models.CharField(max_length=255)
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['attribute', 'value', 'category'], name='attribute_value_facet_unique'),
+        ]
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden FTS5 column named after its table, which accepts MATCH queries."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchIndex(models.Model):
+    """
+    Full-text index over products, backed by the SQLite FTS5 table `product_search`.
+
+    The table is created by a migration and kept in sync by product.search.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_index',
+    )
+    name = models.TextField()
+    description = models.TextField()
+    attributes = models.TextField()
+    document = SearchDocumentField(db_column='product_search')
+    # BM25 score of the current MATCH; lower is a better match
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'product_search'
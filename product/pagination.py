@@ -1,4 +1,231 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+import math
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset, cap):
+    """
+    Count at most `cap` rows of a queryset.
+
+    Returns a (count, is_estimate) tuple. The COUNT runs over a LIMITed subquery,
+    so its cost is bounded by `cap` no matter how large the table is.
+    """
+    count = queryset.order_by()[:cap + 1].count()
+    if count > cap:
+        return cap, True
+    return count, False
+
+
+class ProductKeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination for the product catalog.
+
+    Pages are addressed by an opaque cursor holding the sort value and id of the
+    last row seen, so every page is an indexed range scan instead of an OFFSET,
+    and no COUNT(*) is run unless the client asks for an approximate count.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    # ?count=approximate adds a count capped at `approximate_count_cap`
+    count_query_param = "count"
+    approximate_count_cap = 1000
+    # Sort keys allowed as the leading ordering; `id` is always the tie-breaker
+    keyset_fields = ("id", "name", "price")
+    nullable_fields = ("price",)
+    # JSON types the cursor value of each keyset field may have
+    value_types = {"id": (int,), "name": (str,), "price": (int, float)}
+    invalid_cursor_message = "Invalid cursor"
+    unsupported_ordering_message = (
+        "Cursor pagination needs an ordering by id, name or price; "
+        "relevance ordering of search results is only paginated by page."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+
+        cursor = self.decode_cursor(request)
+        # Walking backwards is a forward walk over the reversed ordering
+        reverse = bool(cursor and cursor["r"])
+        descending = self.descending != reverse
+
+        if self.request.query_params.get(self.count_query_param) == "approximate":
+            self.count = approximate_count(queryset, self.approximate_count_cap)
+        else:
+            self.count = None
+
+        queryset = queryset.order_by(*self.get_order_by(descending))
+        if cursor:
+            queryset = queryset.filter(self.get_seek_filter(cursor["v"], cursor["id"], descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = self.get_position(results[-1])
+            if cursor and (has_more or not reverse):
+                self.previous_position = self.get_position(results[0])
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """
+        Take the leading key from whatever ordering OrderingFilter applied.
+
+        Search results are ordered by relevance, which no cursor can seek on;
+        rather than silently dropping it for `id`, such requests must pick a
+        keyset ordering.
+        """
+        ordering = queryset.query.order_by or ("id",)
+        term = ordering[0]
+        field = term.lstrip("-") if isinstance(term, str) else None
+        if field == "pk":
+            field = "id"
+        if field not in self.keyset_fields:
+            raise ValidationError({"ordering": self.unsupported_ordering_message})
+        return field, term.startswith("-")
+
+    def get_order_by(self, descending):
+        # NULLs sort as the largest value in both directions
+        if self.field == "id":
+            return [F("id").desc() if descending else F("id").asc()]
+        if descending:
+            key = F(self.field).desc(nulls_first=True)
+        else:
+            key = F(self.field).asc(nulls_last=True)
+        return [key, F("id").desc() if descending else F("id").asc()]
+
+    def get_seek_filter(self, value, pk, descending):
+        """Rows strictly after (value, pk) in the given direction."""
+        after_pk = Q(id__lt=pk) if descending else Q(id__gt=pk)
+        if self.field == "id":
+            return after_pk
+
+        if value is None:
+            same = Q(**{f"{self.field}__isnull": True}) & after_pk
+            if descending:
+                return same | Q(**{f"{self.field}__isnull": False})
+            return same
+
+        lookup = "lt" if descending else "gt"
+        condition = Q(**{f"{self.field}__{lookup}": value}) | (Q(**{self.field: value}) & after_pk)
+        if not descending and self.field in self.nullable_fields:
+            condition |= Q(**{f"{self.field}__isnull": True})
+        return condition
+
+    def get_position(self, obj):
+        # Rows are model instances, or dicts on the .values() read path
+        if isinstance(obj, dict):
+            return {"v": obj[self.field], "id": obj["id"]}
+        return {"v": getattr(obj, self.field), "id": obj.pk}
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if cursor["f"] != self.field or cursor["d"] != self.descending:
+                raise ValueError("cursor was issued for another ordering")
+            if not isinstance(cursor["id"], int):
+                raise ValueError("cursor id must be an integer")
+            if not self.is_valid_value(cursor["v"]):
+                raise ValueError("cursor value does not match its field")
+            cursor["r"] = bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def is_valid_value(self, value):
+        if value is None:
+            return self.field in self.nullable_fields
+        if isinstance(value, bool) or not isinstance(value, self.value_types[self.field]):
+            return False
+        return not isinstance(value, float) or math.isfinite(value)
+
+    def encode_cursor(self, position, reverse):
+        cursor = {"f": self.field, "d": self.descending, "v": position["v"], "id": position["id"]}
+        if reverse:
+            cursor["r"] = True
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode("ascii"))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode("ascii"))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.count is not None:
+            payload["count"], payload["count_is_estimate"] = self.count
+        payload.update({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "count_is_estimate": {"type": "boolean"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque keyset cursor taken from a previous next/previous link.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to 'approximate' to include a count capped at "
+                               f"{self.approximate_count_cap} (cursor mode only).",
+                "schema": {"type": "string", "enum": ["approximate"]},
+            },
+        ]
 
 
 class ProductPagination(PageNumberPagination):
@@ -10,3 +237,37 @@ class ProductPagination(PageNumberPagination):
     page_size_query_param = "page_size"
     # Maximum allowed page size to avoid abuse
     max_page_size = 100
+    # ?pagination=cursor (or any ?cursor=) switches the request to keyset pagination
+    mode_query_param = "pagination"
+    keyset_class = ProductKeysetPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to 'cursor' to use keyset pagination instead of page numbers. "
+                               "With `search`, cursors need an explicit ordering by id, name or price "
+                               "(400 otherwise), as relevance cannot be paginated by cursor.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+        ] + self.keyset_class().get_schema_operation_parameters(view)
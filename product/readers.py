@@ -0,0 +1,196 @@
+"""
+Fast read path for the catalog GET endpoints.
+
+Readers build exactly the representation the serializers would, but from
+`.values()` rows plus one grouped query per nested relation, without
+instantiating models or walking serializer fields for every object. Which
+fields to render, and in which order, is taken from the serializer once per
+fieldset and compiled into a plan of column getters.
+
+A reader only handles the fields it knows; when a serializer grows a field
+the reader does not, views fall back to the serializer.
+"""
+from functools import lru_cache
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from .models import ProductAttributeItem, ProductImage
+from .serializers import CategorySerializer, ProductSerializer
+
+
+@lru_cache(maxsize=128)
+def readable_fields(serializer_class, fields, expand):
+    """Names the serializer renders for a fieldset, in output order."""
+    context = {'fields': None if fields is None else set(fields), 'expand': set(expand)}
+    return tuple(name for name, field in serializer_class(context=context).fields.items() if not field.write_only)
+
+
+def as_float(value):
+    return None if value is None else float(value)
+
+
+class Reader:
+    serializer_class = None
+    # Field name -> (columns to select, function building the value from a row)
+    plans = {}
+
+    def __init__(self, request, fields=None, expand=()):
+        self.request = request
+        self.names = readable_fields(
+            self.serializer_class,
+            None if fields is None else frozenset(fields),
+            frozenset(expand),
+        )
+
+    def is_supported(self):
+        return all(name in self.plans for name in self.names)
+
+    def values(self, queryset):
+        columns = dict.fromkeys(column for name in self.names for column in self.plans[name][0])
+        # Keyset pagination reads the sort key back from the last row of the page
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        for term in queryset.query.order_by:
+            if isinstance(term, str) and term.lstrip('-') in concrete:
+                columns[term.lstrip('-')] = None
+        # Relations are loaded by render(), in bulk
+        return queryset.prefetch_related(None).values(*columns)
+
+    def render(self, rows):
+        getters = [(name, self.plans[name][1]) for name in self.names]
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+class CategoryReader(Reader):
+    serializer_class = CategorySerializer
+    plans = {
+        'id': (['id'], lambda row: row['id']),
+        'name': (['name'], lambda row: row['name']),
+    }
+
+
+class ProductReader(Reader):
+    serializer_class = ProductSerializer
+    plans = {
+        'id': (['id'], lambda row: row['id']),
+        'name': (['name'], lambda row: row['name']),
+        'description': (['description'], lambda row: row['description']),
+        'price': (['price'], lambda row: as_float(row['price'])),
+        'category': (
+            ['category_obj_id', 'category_obj__name'],
+            lambda row: {'id': row['category_obj_id'], 'name': row['category_obj__name']},
+        ),
+        'attributes': (['id'], lambda row: row['attributes']),
+        'images': (['id'], lambda row: row['images']),
+        'primary_image': (['id'], lambda row: row['primary_image']),
+    }
+
+    def __init__(self, request, fields=None, expand=()):
+        super().__init__(request, fields, expand)
+        self.storage = ProductImage._meta.get_field('image').storage
+        self.urls = {}
+
+    def render(self, rows):
+        rows = list(rows)
+        product_ids = [row['id'] for row in rows]
+        if 'attributes' in self.names:
+            attributes = self.group_attributes(product_ids)
+            for row in rows:
+                row['attributes'] = attributes.get(row['id'], [])
+        if 'images' in self.names:
+            images = self.group_images(ProductImage.objects.filter(product_id__in=product_ids))
+            for row in rows:
+                row['images'] = images.get(row['id'], [])
+        if 'primary_image' in self.names:
+            if 'images' in self.names:
+                primary = {product_id: gallery[:1] for product_id, gallery in images.items()}
+            else:
+                primary = self.group_images(
+                    ProductImage.objects.filter(product_id__in=product_ids).annotate(
+                        position=Window(
+                            RowNumber(),
+                            partition_by=F('product_id'),
+                            order_by=[F('order').asc(), F('id').asc()],
+                        )
+                    ).filter(position=1)
+                )
+            for row in rows:
+                gallery = primary.get(row['id'])
+                row['primary_image'] = gallery[0] if gallery else None
+        return super().render(rows)
+
+    def group_attributes(self, product_ids):
+        items = ProductAttributeItem.objects.filter(product_id__in=product_ids).order_by('id').values_list(
+            'product_id', 'id', 'attribute_id', 'attribute__name', 'value'
+        )
+        grouped = {}
+        for product_id, pk, attribute_id, attribute_name, value in items:
+            grouped.setdefault(product_id, []).append({
+                'id': pk,
+                'attribute': attribute_id,
+                'attribute_name': attribute_name,
+                'value': value,
+            })
+        return grouped
+
+    def group_images(self, queryset):
+        images = queryset.order_by('order', 'id').values_list('product_id', 'id', 'image', 'order', 'caption', 'variants')
+        grouped = {}
+        for product_id, pk, name, order, caption, variants in images:
+            grouped.setdefault(product_id, []).append({
+                'id': pk,
+                'image': self.url(name) if name else None,
+                'order': order,
+                'caption': caption,
+                'variants': {
+                    variant: {encoding: self.url(variant_name) for encoding, variant_name in encodings.items()}
+                    for variant, encodings in variants.items()
+                },
+            })
+        return grouped
+
+    def url(self, name):
+        # Shared images and their variants are resolved once per response
+        if name not in self.urls:
+            url = self.storage.url(name)
+            self.urls[name] = self.request.build_absolute_uri(url) if self.request else url
+        return self.urls[name]
+
+
+class FastReadMixin:
+    """
+    Serve `fast_read_actions` through `reader_class` instead of the serializer.
+
+    Goes between the caching mixins and the generic view, so cached responses
+    and validators work as before.
+    """
+    reader_class = None
+    fast_read_actions = ('list', 'retrieve')
+
+    def get_reader(self):
+        if self.action not in self.fast_read_actions or self.reader_class is None:
+            return None
+        context = self.get_serializer_context()
+        reader = self.reader_class(self.request, context.get('fields'), context.get('expand') or ())
+        return reader if reader.is_supported() else None
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+        rows = reader.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.render(page))
+        return Response(reader.render(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        if reader is None:
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = reader.values(self.filter_queryset(self.get_queryset()))
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return Response(reader.render([row])[0])
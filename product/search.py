@@ -0,0 +1,146 @@
+"""
+Full-text product search on an SQLite FTS5 table.
+
+`product_search` holds one row per product (rowid = product id) with its name,
+description and attribute names/values. Signals keep it in sync with single
+writes; bulk paths call `index_products()` themselves. On other databases, or
+when the table is missing, `?search=` falls back to DRF's icontains search.
+"""
+import re
+
+from django.conf import settings
+from django.db import OperationalError, connections, router
+from django.db.models import F
+from rest_framework import filters
+
+from .models import Product, ProductAttributeItem, ProductSearchIndex
+
+TABLE = ProductSearchIndex._meta.db_table
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "name, description, attributes, "
+    "tokenize = 'unicode61 remove_diacritics 2', "
+    # Prefix indexes keep typeahead queries for 2 and 3 letter prefixes cheap
+    "prefix = '2 3')"
+)
+CHUNK_SIZE = 1000
+
+_available = {}
+
+
+def get_connection():
+    return connections[router.db_for_write(Product)]
+
+
+def is_available(connection=None):
+    """Whether the FTS5 table exists on this connection's database."""
+    connection = connection or get_connection()
+    if not getattr(settings, 'PRODUCT_SEARCH_FTS', True) or connection.vendor != 'sqlite':
+        return False
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _available:
+        with connection.cursor() as cursor:
+            _available[key] = TABLE in connection.introspection.table_names(cursor)
+    return _available[key]
+
+
+def create_table(connection):
+    """Create the FTS5 table. Returns False when SQLite was built without FTS5."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_TABLE_SQL)
+    except OperationalError:
+        return False
+    _available.pop((connection.alias, connection.settings_dict['NAME']), None)
+    return True
+
+
+def build_documents(product_ids):
+    attributes = {}
+    items = (
+        ProductAttributeItem.objects.filter(product_id__in=product_ids)
+        .order_by('id')
+        .values_list('product_id', 'attribute__name', 'value')
+    )
+    for product_id, attribute_name, value in items:
+        attributes.setdefault(product_id, []).append(f'{attribute_name} {value}')
+    products = Product.objects.filter(pk__in=product_ids).values_list('id', 'name', 'description')
+    return [
+        (pk, name, description, ' '.join(attributes.get(pk, [])))
+        for pk, name, description in products
+    ]
+
+
+def index_products(product_ids):
+    """(Re)index products; ids that no longer exist are dropped from the index."""
+    connection = get_connection()
+    product_ids = list(product_ids)
+    if not product_ids or not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), CHUNK_SIZE):
+            chunk = product_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', chunk)
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, name, description, attributes) VALUES (%s, %s, %s, %s)',
+                build_documents(chunk),
+            )
+
+
+def rebuild_index():
+    """Recreate every row of the index. Returns the number of products indexed."""
+    connection = get_connection()
+    if not is_available(connection) and not create_table(connection):
+        raise RuntimeError('This database does not support SQLite FTS5.')
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    count = 0
+    product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    chunk = []
+    for pk in product_ids.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(pk)
+        if len(chunk) == CHUNK_SIZE:
+            index_products(chunk)
+            count += len(chunk)
+            chunk = []
+    index_products(chunk)
+    count += len(chunk)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return count
+
+
+def build_match_query(search_terms):
+    """
+    Turn user input into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted so FTS5 operators and punctuation in the input are inert.
+    """
+    words = [word for term in search_terms for word in re.findall(r'\w+', term)]
+    return ' AND '.join(f'"{word}"*' for word in words)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    `?search=` over the FTS5 index, annotating each product with its BM25 `search_rank`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        match = build_match_query(search_terms)
+        if not match or not is_available(connections[queryset.db]):
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(search_index__document__match=match).alias(
+            search_rank=F('search_index__rank')
+        )
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """Order full-text results by relevance unless the client picked an ordering."""
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params and 'search_rank' in queryset.query.annotations:
+            return ['search_rank', 'id']
+        return super().get_ordering(request, queryset, view)
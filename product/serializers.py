@@ -7,15 +7,37 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'order', 'caption']
+        fields = ['id', 'image', 'order', 'caption', 'variants']
+
+    def get_variants(self, obj):
+        """URLs of the resized encodings, e.g. {"thumb": {"webp": url, "jpeg": url}}."""
+        request = self.context.get('request')
+        storage = obj.image.storage
+        variants = {}
+        for variant, encodings in obj.variants.items():
+            variants[variant] = {}
+            for encoding, name in encodings.items():
+                url = storage.url(name)
+                variants[variant][encoding] = request.build_absolute_uri(url) if request else url
+        return variants
 
 class ProductAttributeSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductAttribute
         fields = ['id', 'name']
 
+class AttributeNamesSerializer(serializers.Serializer):
+    """The names of a bulk create, held to the model field's length; existing names are allowed."""
+    names = serializers.ListField(
+        child=serializers.CharField(
+            max_length=ProductAttribute._meta.get_field('name').max_length, trim_whitespace=False
+        )
+    )
+
 class ProductAttributeItemSerializer(serializers.ModelSerializer):
     attribute_name = serializers.CharField(source='attribute.name', read_only=True)
     attribute_id = serializers.PrimaryKeyRelatedField(
@@ -44,7 +66,37 @@ class ProductAttributeItemSerializer(serializers.ModelSerializer):
             )
         return data
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Narrow the rendered fields with the `fields` and `expand` serializer context.
+
+    `fields` is the set of readable fields to keep (all of them when absent);
+    fields listed in `expandable_fields` are only rendered when named in `expand`.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        expand = self.context.get('expand') or ()
+        for name in list(self.fields):
+            field = self.fields[name]
+            if name in self.expandable_fields:
+                keep = name in expand
+            else:
+                keep = field.write_only or fields is None or name in fields
+            if not keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_readable_fields(cls):
+        """Names accepted by `fields` and `expand` respectively."""
+        declared = cls().fields
+        readable = [name for name, field in declared.items() if not field.write_only]
+        return [name for name in readable if name not in cls.expandable_fields], list(cls.expandable_fields)
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(source='category_obj', read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         source='category_obj',
@@ -54,6 +106,8 @@ class ProductSerializer(serializers.ModelSerializer):
     attributes = ProductAttributeItemSerializer(many=True, read_only=True)
     product_attributes = ProductAttributeItemSerializer(many=True, write_only=True, required=False)
     images = ProductImageSerializer(many=True, read_only=True)
+    # Only rendered with ?expand=primary_image
+    primary_image = ProductImageSerializer(read_only=True)
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True,
@@ -63,7 +117,8 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'category', 'category_id', 
-                 'attributes', 'product_attributes', 'images', 'uploaded_images']
+                 'attributes', 'product_attributes', 'images', 'primary_image', 'uploaded_images']
+    expandable_fields = ('primary_image',)
 
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, facets, search
+from .models import Category, Product, ProductAttribute, ProductAttributeItem, ProductImage
+
+
+class ProductChanges:
+    """
+    Products changed by a unit of work, and the follow-up work they need:
+    bumping updated_at, invalidating cached responses, reindexing search and
+    recounting facets.
+    """
+
+    def __init__(self):
+        self.product_ids = set()
+        self.category_ids = set()
+        # Products whose category was not at hand when they were recorded
+        self.uncategorized_ids = set()
+        self.touched_ids = set()
+        self.reindex_ids = set()
+        # Products deleted in the batch: nothing left to touch or look up
+        self.deleted_ids = set()
+        self.facet_category_ids = set()
+        self.facet_values = set()
+
+    def add(self, product_id, *category_ids, touch=False, reindex=False, deleted=False):
+        self.product_ids.add(product_id)
+        if deleted:
+            self.deleted_ids.add(product_id)
+        category_ids = {pk for pk in category_ids if pk is not None}
+        if category_ids:
+            self.category_ids |= category_ids
+        else:
+            self.uncategorized_ids.add(product_id)
+        if touch:
+            self.touched_ids.add(product_id)
+        if reindex:
+            self.reindex_ids.add(product_id)
+
+    def add_facets(self, category_ids=(), values=()):
+        """Mark categories and (attribute id, value) pairs whose product counts changed."""
+        self.facet_category_ids.update(pk for pk in category_ids if pk is not None)
+        self.facet_values.update((attribute_id, value) for attribute_id, value in values if attribute_id is not None)
+
+    def flush(self):
+        touched_ids = self.touched_ids - self.deleted_ids
+        if touched_ids:
+            Product.objects.filter(pk__in=touched_ids).touch()
+        # A deleted product recorded its own category
+        uncategorized_ids = self.uncategorized_ids - self.deleted_ids
+        if uncategorized_ids:
+            self.category_ids |= set(
+                Product.objects.filter(pk__in=uncategorized_ids).values_list('category_obj_id', flat=True)
+            )
+        if self.product_ids:
+            cache.invalidate_products(self.product_ids, self.category_ids)
+        search.index_products(self.reindex_ids)
+        facets.refresh_categories(self.facet_category_ids)
+        facets.refresh_attribute_values(self.facet_values)
+
+
+_changes = ContextVar('product_changes', default=None)
+
+
+@contextmanager
+def batched_product_changes():
+    """
+    Coalesce the follow-up work of every product change inside the block.
+
+    Signal handlers record into the batch instead of acting row by row, and
+    bulk operations, which send no signals, record their changes with
+    `changes.add()`. Everything is flushed once when the block exits cleanly.
+    """
+    changes = _changes.get()
+    if changes is not None:
+        # Nested blocks join the outermost batch
+        yield changes
+        return
+    changes = ProductChanges()
+    token = _changes.set(changes)
+    try:
+        yield changes
+    finally:
+        _changes.reset(token)
+    changes.flush()
+
+
+def record_product_change(product_id, *category_ids, touch=False, reindex=False, deleted=False):
+    changes = _changes.get()
+    if changes is not None:
+        changes.add(product_id, *category_ids, touch=touch, reindex=reindex, deleted=deleted)
+        return
+    changes = ProductChanges()
+    changes.add(product_id, *category_ids, touch=touch, reindex=reindex, deleted=deleted)
+    changes.flush()
+
+
+def record_facet_change(category_ids=(), values=()):
+    changes = _changes.get()
+    if changes is not None:
+        changes.add_facets(category_ids, values)
+        return
+    changes = ProductChanges()
+    changes.add_facets(category_ids, values)
+    changes.flush()
+
+
+def get_product_category_id(instance):
+    """Category of a child row's product when it is loaded, otherwise None."""
+    if ProductAttributeItem.product.is_cached(instance) or ProductImage.product.is_cached(instance):
+        return instance.product.category_obj_id
+    return None
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # A product moved to another category leaves that category's lists stale too
+    record_product_change(
+        instance.pk, instance.category_obj_id, instance._loaded_category_id, reindex=True,
+        deleted=kwargs['signal'] is post_delete,
+    )
+
+
+@receiver(post_save, sender=ProductAttributeItem)
+@receiver(post_delete, sender=ProductAttributeItem)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_child_changed(sender, instance, **kwargs):
+    record_product_change(
+        instance.product_id,
+        get_product_category_id(instance),
+        touch=True,
+        reindex=sender is ProductAttributeItem,
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_facets_changed(sender, instance, created=False, **kwargs):
+    moved = instance._loaded_category_id not in (None, instance.category_obj_id)
+    if created or moved or kwargs['signal'] is post_delete:
+        # The attribute values of a moved product now count for another category
+        values = facets.product_values([instance.pk]) if moved else ()
+        record_facet_change([instance.category_obj_id, instance._loaded_category_id], values)
+    instance._loaded_category_id = instance.category_obj_id
+
+
+@receiver(post_save, sender=ProductAttributeItem)
+@receiver(post_delete, sender=ProductAttributeItem)
+def attribute_item_facets_changed(sender, instance, **kwargs):
+    values = {(instance.attribute_id, instance.value)}
+    if kwargs['signal'] is post_save and instance._loaded_attribute_id is not None:
+        values.add((instance._loaded_attribute_id, instance._loaded_value))
+    record_facet_change(values=values)
+    instance._loaded_attribute_id, instance._loaded_value = instance.attribute_id, instance.value
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    cache.invalidate_category(instance.pk)
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def attribute_changed(sender, instance, created=False, **kwargs):
+    cache.invalidate_attributes()
+    if kwargs['signal'] is post_save and not created:
+        # A renamed attribute changes the indexed text of every product using it
+        product_ids = ProductAttributeItem.objects.filter(attribute=instance).values_list('product_id', flat=True)
+        search.index_products(set(product_ids))
@@ -0,0 +1,13 @@
+'use strict';
+{
+    // Reloads the changelist filtered on the object picked in an AutocompleteFilter
+    django.jQuery(document).on('change', '.autocomplete-filter select', function() {
+        const params = new URLSearchParams(this.closest('.autocomplete-filter').dataset.queryString);
+        if (this.value) {
+            params.set(this.name, this.value);
+        } else {
+            params.delete(this.name);
+        }
+        window.location.search = params.toString();
+    });
+}
@@ -0,0 +1,217 @@
+"""
+Content-addressed storage for product images.
+
+Uploads are hashed with SHA-256 while Django streams them in (see the upload
+handlers below), and stored as `product_images/<2 hex>/<sha256>.<ext>`. The
+same photo uploaded for many products is therefore written once, and a
+temporary upload is moved into place rather than copied.
+
+A blob's reference count is the number of ProductImage rows pointing at it
+(the column is indexed). When the last one is deleted or repointed, the blob
+and its variants are removed once the transaction commits.
+`manage.py collect_image_blobs` sweeps blobs orphaned by crashes.
+
+An upload of content that is already stored reuses the blob before its own
+row is committed, so the two sides lock the blob name (see `lock_blob()`):
+a blob found or written by an open transaction is not collected until that
+transaction ends, and one being collected is written again.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+BLOB_NAME_RE = re.compile(r'^(?P<directory>.+)/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.[0-9a-z]{1,5})?$')
+# Variants end with a digest of their content, see product.imaging.variant_name()
+VARIANT_TOKEN_LENGTH = 16
+VARIANT_NAME_RE = re.compile(rf'(?:^|/)variants/[^/]+\.[0-9a-f]{{{VARIANT_TOKEN_LENGTH}}}\.[0-9a-z]{{1,5}}$')
+
+
+class HashingUploadMixin:
+    """Compute the SHA-256 of an upload while its chunks stream in."""
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_digest(content):
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def is_blob_name(name):
+    return bool(name and BLOB_NAME_RE.match(name))
+
+
+def is_fingerprinted_name(name):
+    """Whether `name` changes with the file's content: a blob or a variant."""
+    return is_blob_name(name) or bool(name and VARIANT_NAME_RE.search(name))
+
+
+def file_token(stat_result):
+    """The `v` token of files whose names do not change with their content."""
+    return f'{stat_result.st_mtime_ns:x}{stat_result.st_size:x}'
+
+
+def lock_blob(name, shared=False):
+    """
+    Lock the blob `name` until the current transaction ends.
+
+    Uploads take the lock shared, collection exclusively. On PostgreSQL this
+    is an advisory lock on the digest; SQLite transactions exclude each other
+    already, as SQLITE_TRANSACTION_MODE=IMMEDIATE takes the database's write
+    lock when they begin. Outside a transaction there is nothing to hold it.
+    """
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    # The first 60 bits of the digest fit PostgreSQL's bigint key
+    key = int(BLOB_NAME_RE.match(name)['digest'][:15], 16)
+    function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files after the SHA-256 of their content.
+
+    Files saved into a `variants/` directory are derivatives named by
+    product.imaging and are stored under the name they are given.
+    """
+    derived_directory = 'variants'
+
+    def is_derived(self, name):
+        return self.derived_directory in posixpath.dirname(name).split('/')
+
+    def blob_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()[:6]
+        return posixpath.join(directory, digest[:2], f'{digest}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        if self.is_derived(name):
+            return super().get_available_name(name, max_length)
+        # Blob names are chosen by _save() and identical names mean identical content
+        return name
+
+    def url(self, name):
+        """
+        The URL of `name`, fingerprinted so it can be cached forever.
+
+        Blob and variant names change with their content already; other
+        files (legacy uploads and variants) get a `v` token from their
+        modification time and size.
+        """
+        url = super().url(name)
+        if is_fingerprinted_name(name):
+            return url
+        try:
+            stat_result = os.stat(self.path(name))
+        except (OSError, SuspiciousFileOperation):
+            # A name outside MEDIA_ROOT must not fail the whole response
+            return url
+        return f'{url}?v={file_token(stat_result)}'
+
+    def _save(self, name, content):
+        if self.is_derived(name):
+            return super()._save(name, content)
+
+        name = self.blob_name(name, content_digest(content))
+        # Held until the row referencing the blob is committed
+        lock_blob(name, shared=True)
+        if self.exists(name):
+            return name
+
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                file_move_safe(content.temporary_file_path(), full_path)
+            except FileExistsError:
+                # Stored concurrently by another request with the same content
+                return name
+        else:
+            # Write aside and rename, so readers never see a partial blob
+            partial_path = f'{full_path}.{uuid.uuid4().hex}.partial'
+            with open(partial_path, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.replace(partial_path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+
+def get_product_image_storage():
+    return ContentAddressedStorage()
+
+
+def delete_blob_if_unreferenced(storage, name, variants=None):
+    """Remove a blob and its variants when no ProductImage points at it anymore."""
+    from .imaging import derived_names
+    from .models import ProductImage
+
+    if not is_blob_name(name):
+        return False
+    with transaction.atomic():
+        # Waits for uploads still to commit a reference to the blob
+        lock_blob(name)
+        if ProductImage.objects.filter(image=name).exists():
+            return False
+        names = set(derived_names(storage, name))
+        names.update(variant for encodings in (variants or {}).values() for variant in encodings.values())
+        for variant in names:
+            storage.delete(variant)
+        storage.delete(name)
+    return True
+
+
+def release_blob(storage, name, variants):
+    transaction.on_commit(lambda: delete_blob_if_unreferenced(storage, name, variants))
+
+
+@receiver(post_delete, sender='product.ProductImage')
+def image_deleted(sender, instance, **kwargs):
+    release_blob(instance.image.storage, instance.image.name, instance.variants)
+
+
+@receiver(post_save, sender='product.ProductImage')
+def image_repointed(sender, instance, created, **kwargs):
+    previous = instance._loaded_image_name
+    if not created and previous and previous != instance.image.name:
+        release_blob(instance.image.storage, previous, instance._loaded_variants)
+    instance._loaded_image_name = instance.image.name
+    instance._loaded_variants = instance.variants
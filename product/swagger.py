@@ -1,4 +1,4 @@
-from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample
+from drf_spectacular.utils import extend_schema, extend_schema_view, inline_serializer, OpenApiParameter, OpenApiExample
 from .serializers import (
     CategorySerializer,
     ProductSerializer,
@@ -27,9 +27,28 @@ attribute_schema = extend_schema_view(
 )
 
 # Product ViewSet schema definitions
+sparse_fieldset_parameters = [
+    OpenApiParameter(
+        name="fields",
+        description="Comma-separated fields to render, e.g. id,name,price. "
+                    "Nested relations that are left out are not loaded at all",
+        required=False,
+        type=str
+    ),
+    OpenApiParameter(
+        name="expand",
+        description="Comma-separated optional fields to add: primary_image (the first image)",
+        required=False,
+        type=str
+    ),
+]
+
 product_schema = extend_schema_view(
-    list=extend_schema(description="List all products"),
-    retrieve=extend_schema(description="Get detailed information about a specific product"),
+    list=extend_schema(description="List all products", parameters=sparse_fieldset_parameters),
+    retrieve=extend_schema(
+        description="Get detailed information about a specific product",
+        parameters=sparse_fieldset_parameters
+    ),
     create=extend_schema(description="Create a new product"),
     update=extend_schema(description="Update a product"),
     partial_update=extend_schema(description="Partially update a product"),
@@ -37,8 +56,18 @@ product_schema = extend_schema_view(
 )
 
 # Custom action schema definitions
+bulk_create_result = inline_serializer(
+    name="AttributeBulkCreateResult",
+    fields={
+        "created": ProductAttributeSerializer(many=True),
+        "existing": ProductAttributeSerializer(many=True),
+    }
+)
+
 bulk_create_schema = extend_schema(
-    description="Create multiple product attributes at once",
+    description="Create multiple product attributes at once. Names are deduplicated; "
+                "the response lists the attributes that were created and those that already existed "
+                "(201 when anything was created, 200 otherwise)",
     request={
         "application/json": {
             "type": "object",
@@ -52,23 +81,34 @@ bulk_create_schema = extend_schema(
             "required": ["names"]
         }
     },
-    responses={201: ProductAttributeSerializer(many=True)}
+    responses={
+        201: bulk_create_result,
+        200: bulk_create_result,
+    }
 )
 
 search_or_create_schema = extend_schema(
-    description="Search for attributes by name, optionally creating if not found",
+    description="Typeahead search over attribute names: names starting with the query come first, "
+                "then names with a later word starting with it (case-insensitive). Optionally creates "
+                "the attribute when no name matches the query exactly",
     parameters=[
         OpenApiParameter(
             name="name", 
-            description="Name to search for", 
+            description="Name prefix to search for", 
             required=True, 
             type=str
         ),
         OpenApiParameter(
             name="create", 
-            description="Create attribute if not found (true/false)", 
+            description="Create attribute if no attribute has this exact name, in any case (true/false)", 
             required=False, 
             type=bool
+        ),
+        OpenApiParameter(
+            name="limit",
+            description="Maximum number of results (default 20, at most 100)",
+            required=False,
+            type=int
         )
     ],
     responses={200: ProductAttributeSerializer(many=True)}
@@ -145,3 +185,115 @@ update_attributes_schema = extend_schema(
     },
     responses={200: ProductDetailSerializer}
 )
+
+facets_schema = extend_schema(
+    description="Product counts per category and per attribute value for the products matching "
+                "the current filters and search. Unfiltered and per-category requests are answered "
+                "from precomputed counts",
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "categories": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "name": {"type": "string"},
+                            "count": {"type": "integer"}
+                        }
+                    }
+                },
+                "attributes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "name": {"type": "string"},
+                            "values": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "value": {"type": "string"},
+                                        "count": {"type": "integer"}
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
+
+cache_stats_schema = extend_schema(
+    description="Hit/miss counters of the product response cache",
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "hits": {"type": "integer"},
+                "misses": {"type": "integer"},
+                "hit_rate": {"type": "number", "nullable": True}
+            }
+        }
+    }
+)
+
+import_products_schema = extend_schema(
+    description="Import products from a CSV or JSONL file. Rows are written in batches; "
+                "invalid rows are reported by line number and do not stop the import. Bytes that are "
+                "not UTF-8 do, with a 400 that still counts the rows created before them",
+    request={
+        "multipart/form-data": {
+            "type": "object",
+            "properties": {
+                "file": {"type": "string", "format": "binary", "description": "CSV or JSONL file"},
+                "format": {"type": "string", "enum": ["csv", "jsonl"], "description": "Defaults to the file extension"},
+                "create_categories": {"type": "boolean", "description": "Create unknown categories (default true)"}
+            },
+            "required": ["file"]
+        }
+    },
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "created": {"type": "integer"},
+                "failed": {"type": "integer"},
+                "errors": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "line": {"type": "integer"},
+                            "errors": {"type": "object"}
+                        }
+                    }
+                },
+                "errors_truncated": {"type": "boolean"}
+            }
+        }
+    }
+)
+
+export_products_schema = extend_schema(
+    description="Stream the whole catalog, or the products matching the filters, as JSONL or CSV",
+    parameters=[
+        OpenApiParameter(
+            name="file_format",
+            description="jsonl (default) or csv",
+            required=False,
+            type=str,
+            enum=["jsonl", "csv"]
+        )
+    ],
+    responses={
+        (200, "application/x-ndjson"): {"type": "string"},
+        (200, "text/csv"): {"type": "string"}
+    }
+)
@@ -0,0 +1,168 @@
+"""
+Deterministic synthetic catalogs for benchmarks.
+
+`generate_catalog()` writes categories, attributes, products, attribute
+items and image rows with bulk_create, one batch of products per
+transaction. Everything is drawn from a random generator seeded with
+`seed`, one product at a time, so the same arguments produce the same
+names, descriptions, prices, categories and attribute values whatever the
+batch size or machine: runs on two branches measure the same data.
+
+Categories are skewed like a real shop (the first holds the most
+products) and each draws its products' attributes from its own subset of
+the attribute names, so attribute filters and facets are as selective as
+they would be in production. Even attributes hold numbers with a unit
+("16GB") for range filters, odd ones hold labels. Image rows point at
+files that do not exist.
+
+Every category and attribute name starts with the catalog's prefix,
+which is how `delete_catalog()` and the benchmarks find it again.
+"""
+import random
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import cache, facets, search
+from .models import Category, Product, ProductAttribute, ProductAttributeItem, ProductImage
+from .signals import batched_product_changes
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+ADJECTIVES = [
+    'compact', 'wireless', 'portable', 'ergonomic', 'silent', 'rugged', 'slim', 'smart', 'classic',
+    'professional', 'modular', 'lightweight', 'premium', 'budget', 'outdoor', 'vintage',
+]
+NOUNS = [
+    'laptop', 'monitor', 'keyboard', 'headphones', 'speaker', 'camera', 'router', 'drone', 'tablet',
+    'charger', 'backpack', 'lamp', 'blender', 'kettle', 'watch', 'projector',
+]
+WORDS = ADJECTIVES + NOUNS + [
+    'with', 'and', 'for', 'the', 'battery', 'display', 'warranty', 'design', 'steel', 'aluminium',
+    'fast', 'quiet', 'home', 'office', 'travel', 'gaming', 'edition', 'kit', 'case', 'cable',
+]
+UNITS = ['GB', 'W', 'mm', 'g', 'MHz', 'mAh', 'in', 'L']
+NUMBERS = [1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 128, 256, 512, 1024]
+LABELS = [
+    'black', 'white', 'silver', 'red', 'blue', 'green', 'oak', 'walnut', 'matte', 'glossy',
+    'cotton', 'leather', 'plastic', 'glass', 'ceramic', 'carbon',
+]
+VALUES_PER_ATTRIBUTE = 8
+
+
+def category_name(prefix, index):
+    return f'{prefix} category {index:04}'
+
+
+def attribute_name(prefix, index):
+    return f'{prefix} attribute {index:04}'
+
+
+def attribute_values(index, rng):
+    """The values attribute number `index` takes: numbers with a unit, or labels."""
+    if index % 2 == 0:
+        unit = UNITS[index // 2 % len(UNITS)]
+        return [f'{number}{unit}' for number in sorted(rng.sample(NUMBERS, VALUES_PER_ATTRIBUTE))]
+    return rng.sample(LABELS, VALUES_PER_ATTRIBUTE)
+
+
+def generate_catalog(
+    products, categories=50, attributes=200, attributes_per_product=8, images_per_product=3,
+    seed=0, prefix='Synthetic', batch_size=2000, progress=None,
+):
+    """
+    Write a synthetic catalog and return the number of rows written per model.
+
+    `progress(products written)` is called after every batch. Raises
+    ValueError when a catalog with this prefix already exists.
+    """
+    if not 0 <= attributes_per_product <= attributes:
+        raise ValueError('attributes_per_product must be between 0 and attributes.')
+    rng = random.Random(seed)
+    values = [attribute_values(index, rng) for index in range(attributes)]
+    # Each category picks its products' attributes from twice as many names
+    category_attributes = [
+        rng.sample(range(attributes), min(attributes, attributes_per_product * 2)) for _ in range(categories)
+    ]
+    category_weights = [1 / (index + 1) for index in range(categories)]
+    image_directory = f'product_images/{slugify(prefix)}'
+
+    with transaction.atomic():
+        if Category.objects.filter(name__startswith=f'{prefix} ').exists():
+            raise ValueError(f'A catalog with the prefix "{prefix}" already exists.')
+        names = [category_name(prefix, index) for index in range(categories)]
+        Category.objects.bulk_create([Category(name=name) for name in names])
+        category_ids = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        category_ids = [category_ids[name] for name in names]
+        attribute_objs, _ = ProductAttribute.objects.get_or_create_many(
+            [attribute_name(prefix, index) for index in range(attributes)]
+        )
+        attribute_ids = [attribute_objs[attribute_name(prefix, index)].id for index in range(attributes)]
+
+    counts = {'categories': categories, 'attributes': attributes, 'products': 0, 'attribute_items': 0, 'images': 0}
+    facet_values = set()
+    for start in range(0, products, batch_size):
+        rows = []
+        for index in range(start, min(start + batch_size, products)):
+            category = rng.choices(range(categories), category_weights)[0]
+            rows.append((
+                index,
+                Product(
+                    name=f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(NOUNS)} {index}',
+                    description=' '.join(rng.choices(WORDS, k=24)),
+                    price=round(rng.lognormvariate(4, 1), 2),
+                    category_obj_id=category_ids[category],
+                ),
+                [
+                    (attribute_ids[attribute], rng.choice(values[attribute]))
+                    for attribute in rng.sample(category_attributes[category], attributes_per_product)
+                ],
+            ))
+
+        with transaction.atomic():
+            created = Product.objects.bulk_create([product for _, product, _ in rows])
+            items, images = [], []
+            for product, (index, _, product_values) in zip(created, rows):
+                items.extend(
+                    ProductAttributeItem(product_id=product.id, attribute_id=attribute_id, value=value)
+                    for attribute_id, value in product_values
+                )
+                images.extend(
+                    ProductImage(product_id=product.id, image=f'{image_directory}/{index}_{order}.jpg', order=order)
+                    for order in range(images_per_product)
+                )
+            ProductAttributeItem.objects.bulk_create(items, batch_size=batch_size)
+            ProductImage.objects.bulk_create(images, batch_size=batch_size)
+            search.index_products([product.id for product in created])
+        facet_values.update((item.attribute_id, item.value) for item in items)
+        counts['products'] += len(created)
+        counts['attribute_items'] += len(items)
+        counts['images'] += len(images)
+        if progress is not None:
+            progress(counts['products'])
+
+    with transaction.atomic():
+        facets.refresh_categories(category_ids)
+        facets.refresh_attribute_values(facet_values)
+        for category_id in category_ids:
+            cache.invalidate_category(category_id)
+        cache.invalidate_attributes()
+    return counts
+
+
+def delete_catalog(prefix, batch_size=2000):
+    """Delete the catalog generated with `prefix`, a batch of products per transaction. Returns the products deleted."""
+    categories = Category.objects.filter(name__startswith=f'{prefix} ')
+    products = Product.objects.filter(category_obj__in=categories).order_by('pk').values_list('pk', flat=True)
+    deleted = 0
+    while True:
+        with transaction.atomic(), batched_product_changes():
+            product_ids = list(products[:batch_size])
+            Product.objects.filter(pk__in=product_ids).delete()
+        deleted += len(product_ids)
+        if len(product_ids) < batch_size:
+            break
+    with transaction.atomic():
+        categories.delete()
+        ProductAttribute.objects.filter(name__startswith=f'{prefix} ').delete()
+    return deleted
@@ -0,0 +1,187 @@
+"""
+In-process index of attribute names for the search_or_create typeahead.
+
+Names are kept casefolded in two sorted lists: one of whole names and one of
+every later word of a name ("size" in "Screen size"). A lookup is a bisect
+plus a walk over at most `limit` entries, so it does not grow with the
+number of attributes and never queries the database.
+
+Each process builds the index lazily and brings it up to date when the
+ATTRIBUTES version counter of product.cache moves, i.e. after any
+ProductAttribute write. Catching up reads only the attributes saved since
+the last sync (by `updated_at`, with SYNC_OVERLAP to spare for clock skew
+and slow commits) and inserts them into copies of the lists; the index is
+built from scratch when the count and sum of the attribute ids show a row
+it did not see, such as a deletion (ids only grow, so new rows cannot make
+up for deleted ones), or when more than REBUILD_AFTER names changed.
+"""
+import hashlib
+import re
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import cache
+from .models import ProductAttribute
+
+WORD_SEPARATOR_RE = re.compile(r'[\s\-_/.,:;()]+')
+SYNC_OVERLAP = timedelta(minutes=5)
+# Above this many changed names a rebuild is cheaper than the inserts
+REBUILD_AFTER = 1000
+
+_index = None
+_lock = threading.Lock()
+
+
+def name_words(folded):
+    return {word for word in WORD_SEPARATOR_RE.split(folded)[1:] if word}
+
+
+class AttributeNameIndex:
+    def __init__(self, version, rows, synced_at):
+        self.version = version
+        self.synced_at = synced_at
+        self.rows = dict(rows)
+        self.names = sorted((name.casefold(), pk, name) for pk, name in self.rows.items())
+        self.words = sorted(
+            (word, name.casefold(), pk, name)
+            for pk, name in self.rows.items()
+            for word in name_words(name.casefold())
+        )
+
+    def updated(self, version, rows, synced_at):
+        """A copy with `rows`, the (id, name) pairs saved since the last sync, added or renamed."""
+        index = object.__new__(type(self))
+        index.version = version
+        index.synced_at = synced_at
+        index.rows = dict(self.rows)
+        index.names = list(self.names)
+        index.words = list(self.words)
+        for pk, name in rows:
+            old = index.rows.get(pk)
+            if old == name:
+                continue
+            if old is not None:
+                index.discard(pk, old)
+            index.rows[pk] = name
+            folded = name.casefold()
+            insort(index.names, (folded, pk, name))
+            for word in name_words(folded):
+                insort(index.words, (word, folded, pk, name))
+        return index
+
+    def discard(self, pk, name):
+        folded = name.casefold()
+        entries = [(self.names, (folded, pk, name))]
+        entries += [(self.words, (word, folded, pk, name)) for word in name_words(folded)]
+        for entries_list, entry in entries:
+            position = bisect_left(entries_list, entry)
+            if position < len(entries_list) and entries_list[position] == entry:
+                del entries_list[position]
+
+    @staticmethod
+    def walk(entries, prefix):
+        for entry in entries[bisect_left(entries, (prefix,)):]:
+            if not entry[0].startswith(prefix):
+                return
+            yield entry
+
+    def search(self, query, limit):
+        """
+        (id, name) pairs of names starting with `query`, case-insensitively,
+        then of names with a later word starting with it. Each group is sorted
+        by name, so an exact match comes first.
+        """
+        prefix = query.casefold()
+        results = {}
+        for _, pk, name in self.walk(self.names, prefix):
+            if len(results) >= limit:
+                break
+            results[pk] = name
+        if len(results) < limit:
+            # Bounded walk; names matching on several words appear once
+            for _, _, pk, name in self.walk(self.words, prefix):
+                if len(results) >= limit:
+                    break
+                results.setdefault(pk, name)
+        return list(results.items())
+
+    def get(self, name):
+        """The (id, name) of the attribute named `name` in any case, or None."""
+        key = name.casefold()
+        for folded, pk, original in self.walk(self.names, key):
+            if folded == key:
+                return pk, original
+            break
+        return None
+
+
+def sync(index, version):
+    """`index` brought up to `version`, or a new index when there is none or it cannot catch up."""
+    # Taken before reading, so the next sync overlaps this one rather than leaving a gap
+    synced_at = timezone.now()
+    attributes = ProductAttribute.objects.all()
+    if index is not None:
+        changed = list(attributes.filter(updated_at__gte=index.synced_at - SYNC_OVERLAP).values_list('id', 'name'))
+        if len(changed) <= REBUILD_AFTER:
+            updated = index.updated(version, changed, synced_at)
+            totals = attributes.aggregate(count=Count('id'), sum=Sum('id'))
+            if (len(updated.rows), sum(updated.rows)) == (totals['count'], totals['sum'] or 0):
+                return updated
+    return AttributeNameIndex(version, attributes.values_list('id', 'name'), synced_at)
+
+
+def get_index():
+    global _index
+    version = cache.get_versions([cache.ATTRIBUTES])[cache.ATTRIBUTES]
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = sync(_index, version)
+        return _index
+
+
+def search(query, limit):
+    return get_index().search(query, limit)
+
+
+def lock_name(name):
+    """
+    Lock `name` in every case until the current transaction ends.
+
+    On PostgreSQL this is an advisory lock on the casefolded name; SQLite
+    transactions exclude each other already, as SQLITE_TRANSACTION_MODE=IMMEDIATE
+    takes the database's write lock when they begin.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    # The first 60 bits of the digest fit PostgreSQL's bigint key
+    key = int(hashlib.sha256(name.casefold().encode()).hexdigest()[:15], 16)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+def get_or_create(name):
+    """
+    The attribute named `name` in any case, created if there is none.
+
+    The unique constraint on the name is case-sensitive, so concurrent
+    editors typing "Color" and "color" would both pass it: creation locks
+    the casefolded name and looks the name up again, case-insensitively,
+    before inserting.
+    """
+    found = get_index().get(name)
+    if found is not None:
+        return ProductAttribute(pk=found[0], name=found[1]), False
+    with transaction.atomic():
+        lock_name(name)
+        existing = ProductAttribute.objects.filter(name__iexact=name).order_by('pk').first()
+        if existing is not None:
+            return existing, False
+        return ProductAttribute.objects.get_or_create(name=name)
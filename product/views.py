@@ -1,6 +1,11 @@
+import inspect
+
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import MethodMapper, action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Category, Product, ProductImage, ProductAttribute, ProductAttributeItem
 from .serializers import (
@@ -8,9 +13,17 @@ from .serializers import (
     ProductSerializer,
     ProductDetailSerializer,
     ProductImageSerializer,
-    ProductAttributeSerializer
+    ProductAttributeSerializer,
+    AttributeNamesSerializer
 )
+from . import exporters, facets, typeahead
+from .filters import AttributeFilterBackend
+from .importers import FORMATS, ProductImporter, guess_format
 from .pagination import ProductPagination
+from .readers import CategoryReader, FastReadMixin, ProductReader
+from .search import ProductSearchFilter, SearchRankOrderingFilter
+from .signals import batched_product_changes
+from . import cache
 from .swagger import (
     category_schema, 
     attribute_schema, 
@@ -19,74 +32,232 @@ from .swagger import (
     search_or_create_schema,
     add_images_schema,
     update_image_order_schema,
-    update_attributes_schema
+    update_attributes_schema,
+    cache_stats_schema,
+    facets_schema,
+    import_products_schema,
+    export_products_schema
 )
 
+
+class StaticExtraActionsMixin:
+    """
+    ViewSetMixin.get_extra_actions() without inspect.getmembers().
+
+    getmembers() evaluates every attribute of the class, including the
+    APIView.schema descriptor, which instantiates DEFAULT_SCHEMA_CLASS and so
+    imports all of drf-spectacular when the router builds its URLs.
+    """
+
+    @classmethod
+    def get_extra_actions(cls):
+        actions = []
+        for name in sorted(dir(cls)):
+            attr = inspect.getattr_static(cls, name)
+            if isinstance(getattr(attr, 'mapping', None), MethodMapper):
+                assert attr.__name__ == name, f'Expected the action {attr.__name__} to be named {name}'
+                actions.append(attr)
+        return actions
+
+
+class BatchedDestroyMixin:
+    """
+    Deletes in one transaction, with the follow-up work of every cascaded
+    row (touching, reindexing, recounting facets) coalesced into one batch
+    instead of run per row by the post_delete receivers.
+    """
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), batched_product_changes():
+            super().perform_destroy(instance)
+
+
 @category_schema
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    StaticExtraActionsMixin, BatchedDestroyMixin, cache.ConditionalGetMixin, FastReadMixin, viewsets.ModelViewSet
+):
     """
     API endpoints for managing product categories.
     """
-    queryset = Category.objects.all()
+    # A stable order keeps the representation, and so the strong ETag, deterministic
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
+    reader_class = CategoryReader
+    cache_scopes = [cache.CATEGORIES]
 
 @attribute_schema
-class ProductAttributeViewSet(viewsets.ModelViewSet):
+class ProductAttributeViewSet(
+    StaticExtraActionsMixin, BatchedDestroyMixin, cache.ConditionalGetMixin, viewsets.ModelViewSet
+):
     """
     API endpoints for managing product attributes.
     """
-    queryset = ProductAttribute.objects.all()
+    queryset = ProductAttribute.objects.order_by('id')
     serializer_class = ProductAttributeSerializer
+    cache_scopes = [cache.ATTRIBUTES]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
     
     @bulk_create_schema
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
-        """Create multiple attributes at once."""
+        """Create multiple attributes at once, reporting which names already existed."""
         names = request.data.get('names', [])
-        attributes = []
-        for name in names:
-            attribute, created = ProductAttribute.objects.get_or_create(name=name)
-            attributes.append(attribute)
-        
-        serializer = self.get_serializer(attributes, many=True)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not isinstance(names, list) or not all(isinstance(name, str) and name for name in names):
+            return Response(
+                {"error": "names must be a list of non-empty strings"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # An overlong name would only fail in the insert, as a DataError on PostgreSQL
+        AttributeNamesSerializer(data={'names': names}).is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            attributes, created = ProductAttribute.objects.get_or_create_many(names)
+        if created:
+            # bulk_create sends no post_save signals
+            cache.invalidate_attributes()
+
+        result = {"created": [], "existing": []}
+        created = set(created)
+        for name in dict.fromkeys(names):
+            if name in attributes:
+                result["created" if name in created else "existing"].append(attributes[name])
+        return Response(
+            {key: self.get_serializer(items, many=True).data for key, items in result.items()},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
     
     @search_or_create_schema
     @action(detail=False, methods=['get'])
     def search_or_create(self, request):
-        """Search for attributes by name, returns matches or creates if none found."""
-        query = request.query_params.get('name', '')
+        """Typeahead over attribute names, optionally creating the typed name if it is missing."""
+        query = request.query_params.get('name', '').strip()
         if not query:
             return Response(
                 {"error": "Name parameter is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        # Search for existing attributes
-        attributes = ProductAttribute.objects.filter(name__icontains=query)
-        if not attributes.exists() and request.query_params.get('create', 'false').lower() == 'true':
-            # Create new attribute if requested
-            attribute = ProductAttribute.objects.create(name=query)
-            attributes = [attribute]
-            
-        serializer = self.get_serializer(attributes, many=True)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = [ProductAttribute(pk=pk, name=name) for pk, name in typeahead.search(query, limit)]
+        if request.query_params.get('create', 'false').lower() == 'true':
+            attribute, created = typeahead.get_or_create(query)
+            if created:
+                # The new name is the best match for what was typed
+                matches = [attribute, *matches][:limit]
+
+        serializer = self.get_serializer(matches, many=True)
         return Response(serializer.data)
     
 @product_schema
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    StaticExtraActionsMixin, BatchedDestroyMixin, cache.ConditionalGetMixin, cache.CachedResponseMixin,
+    FastReadMixin, viewsets.ModelViewSet,
+):
     """
     API endpoints for managing products.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    reader_class = ProductReader
     pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, AttributeFilterBackend, ProductSearchFilter, SearchRankOrderingFilter]
     filterset_fields = ['category_obj']
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price']
-    
+    ordering = ['id']
+    last_modified_fields = ['updated_at', 'category_obj__updated_at']
+    # Actions whose response nests category, attributes and images
+    related_actions = {'list', 'retrieve', 'update', 'partial_update'}
+    nested_fields = ('category', 'attributes', 'images')
+    # Actions that honour ?fields= and ?expand=
+    sparse_actions = {'list', 'retrieve'}
+    # Product columns read by each rendered field; nested ones are prefetched
+    field_columns = {
+        'id': ['id'],
+        'name': ['name'],
+        'description': ['description'],
+        'price': ['price'],
+        'category': ['category_obj__name'],
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.related_actions:
+            fields, expand = self.get_sparse_fieldset()
+            queryset = queryset.with_related(set(self.nested_fields if fields is None else fields) | expand)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, _ = self.get_sparse_fieldset()
+        if fields is not None:
+            queryset = queryset.only(*self.get_sparse_columns(fields, queryset))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_sparse_fieldset()
+        return context
+
+    def get_sparse_fieldset(self):
+        """
+        The (fields, expand) sets requested with ?fields=id,name and ?expand=primary_image.
+
+        `fields` is None when every field is rendered.
+        """
+        if self.action not in self.sparse_actions:
+            return None, set()
+        if not hasattr(self, '_sparse_fieldset'):
+            readable, expandable = self.get_serializer_class().get_readable_fields()
+            self._sparse_fieldset = (
+                self.parse_field_list('fields', readable),
+                self.parse_field_list('expand', expandable) or set(),
+            )
+        return self._sparse_fieldset
+
+    def parse_field_list(self, param, allowed):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names.difference(allowed)
+        if unknown:
+            raise ValidationError({
+                param: f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                       f"Choose from: {', '.join(allowed)}."
+            })
+        return names
+
+    def get_sparse_columns(self, fields, queryset):
+        columns = ['id']
+        for name in fields:
+            columns.extend(self.field_columns.get(name, []))
+        # Keyset pagination reads the sort key back from the last row of the page
+        concrete = {field.name for field in Product._meta.concrete_fields}
+        for term in queryset.query.order_by:
+            if isinstance(term, str) and term.lstrip('-') in concrete:
+                columns.append(term.lstrip('-'))
+        return columns
+
+    def get_cache_scopes(self):
+        if self.action == 'retrieve':
+            return [cache.product_scope(self.kwargs['pk']), cache.CATEGORIES, cache.ATTRIBUTES]
+        # Lists narrowed to one category only go stale when that category changes
+        category_ids = self.request.query_params.getlist('category_obj')
+        if len(category_ids) == 1 and category_ids[0].isdigit():
+            return [cache.category_scope(int(category_ids[0])), cache.ATTRIBUTES]
+        return [cache.CATALOG, cache.ATTRIBUTES]
+
+    def get_detail_response(self, product):
+        """Serialize a freshly loaded product after one of the custom actions changed it."""
+        product = Product.objects.with_related().get(pk=product.pk)
+        serializer = ProductDetailSerializer(product, context=self.get_serializer_context())
+        return Response(serializer.data)
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
@@ -98,81 +269,199 @@ class ProductViewSet(viewsets.ModelViewSet):
         """Add one or more images to a product."""
         product = self.get_object()
         images_data = request.FILES.getlist('images')
-        order = ProductImage.objects.filter(product=product).count()
-        
-        for image_data in images_data:
-            ProductImage.objects.create(
-                product=product,
-                image=image_data,
-                order=order
-            )
-            order += 1
-            
-        serializer = ProductDetailSerializer(product)
-        return Response(serializer.data)
+
+        with transaction.atomic(), batched_product_changes():
+            order = ProductImage.objects.filter(product=product).count()
+            for image_data in images_data:
+                ProductImage.objects.create(
+                    product=product,
+                    image=image_data,
+                    order=order
+                )
+                order += 1
+
+        return self.get_detail_response(product)
     
     @update_image_order_schema
     @action(detail=True, methods=['post'])
     def update_image_order(self, request, pk=None):
         """Update the display order of product images."""
-        product = self.get_object()
         image_orders = request.data.get('image_orders', [])
-        
+
+        # Later entries for the same image win, as they did when saved one by one
+        new_orders = {}
         for image_order in image_orders:
             image_id = image_order.get('id')
             new_order = image_order.get('order')
-            
             if image_id and new_order is not None:
-                try:
-                    image = ProductImage.objects.get(id=image_id, product=product)
-                    image.order = new_order
-                    image.save()
-                except ProductImage.DoesNotExist:
-                    pass
-                    
-        serializer = ProductDetailSerializer(product)
-        return Response(serializer.data)
+                new_orders[str(image_id)] = new_order
+
+        with transaction.atomic(), batched_product_changes() as changes:
+            product = self.get_object()
+            images = list(ProductImage.objects.filter(product=product, id__in=self.valid_ids(new_orders)))
+            for image in images:
+                image.order = new_orders[str(image.id)]
+            if images:
+                ProductImage.objects.bulk_update(images, ['order'])
+                changes.add(product.pk, product.category_obj_id, touch=True)
+
+        return self.get_detail_response(product)
     
     @update_attributes_schema
     @action(detail=True, methods=['post'])
     def update_attributes(self, request, pk=None):
         """Update product attributes in bulk."""
-        product = self.get_object()
         attributes_data = request.data.get('attributes', [])
-        
-        # Clear existing attributes if specified
-        if request.data.get('clear_existing', False):
-            product.attributes.all().delete()
-        
-        created_attributes = []
-        for attr_data in attributes_data:
-            # Handle new attribute creation
-            if 'attribute_name_new' in attr_data:
-                attribute, _ = ProductAttribute.objects.get_or_create(
-                    name=attr_data['attribute_name_new']
-                )
-                attr_data['attribute'] = attribute.id
-                del attr_data['attribute_name_new']
-            
-            # Create or update attribute item
-            if 'id' in attr_data:
-                # Update existing attribute item
-                try:
-                    attr_item = product.attributes.get(id=attr_data['id'])
-                    for key, value in attr_data.items():
-                        if key != 'id':
-                            setattr(attr_item, key, value)
-                    attr_item.save()
-                    created_attributes.append(attr_item)
-                except ProductAttributeItem.DoesNotExist:
-                    pass
-            else:
-                # Create new attribute item
-                attr_item = product.attributes.create(
-                    attribute_id=attr_data['attribute'],
-                    value=attr_data['value']
-                )
-                created_attributes.append(attr_item)
-        
-        serializer = ProductDetailSerializer(product)
-        return Response(serializer.data)
+        errors = self.validate_attribute_items(attributes_data)
+        if errors:
+            return Response({"attributes": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic(), batched_product_changes() as changes:
+            product = self.get_object()
+
+            # Clear existing attributes if specified
+            if request.data.get('clear_existing', False):
+                product.attributes.all().delete()
+
+            # Resolve every attribute name and item id up front
+            new_names = [data['attribute_name_new'] for data in attributes_data if 'attribute_name_new' in data]
+            attributes, created = ProductAttribute.objects.get_or_create_many(new_names) if new_names else ({}, [])
+            if created:
+                cache.invalidate_attributes()
+            items = product.attributes.in_bulk(self.valid_ids(data['id'] for data in attributes_data if 'id' in data))
+
+            to_update, to_create = {}, []
+            for data in attributes_data:
+                if 'attribute_name_new' in data:
+                    attribute_id = attributes[data['attribute_name_new']].id
+                else:
+                    attribute_id = data.get('attribute')
+
+                if 'id' in data:
+                    # Update existing attribute item; unknown ids are skipped
+                    item = items.get(int(data['id']))
+                    if item is None:
+                        continue
+                    if attribute_id is not None:
+                        item.attribute_id = attribute_id
+                    if 'value' in data:
+                        item.value = data['value']
+                    to_update[item.id] = item
+                else:
+                    to_create.append(
+                        ProductAttributeItem(product=product, attribute_id=attribute_id, value=data['value'])
+                    )
+
+            if to_update:
+                ProductAttributeItem.objects.bulk_update(to_update.values(), ['attribute', 'value'])
+            if to_create:
+                ProductAttributeItem.objects.bulk_create(to_create)
+            if to_update or to_create:
+                changes.add(product.pk, product.category_obj_id, touch=True, reindex=True)
+                changes.add_facets(values=[
+                    *((item._loaded_attribute_id, item._loaded_value) for item in to_update.values()),
+                    *((item.attribute_id, item.value) for item in [*to_update.values(), *to_create]),
+                ])
+
+        return self.get_detail_response(product)
+
+    @staticmethod
+    def valid_ids(ids):
+        return [int(pk) for pk in ids if str(pk).isdigit()]
+
+    def validate_attribute_items(self, attributes_data):
+        """Per-item errors for an update_attributes payload, resolved with a single query."""
+        if not isinstance(attributes_data, list) or not all(isinstance(data, dict) for data in attributes_data):
+            return ["Expected a list of objects."]
+
+        attribute_ids = self.valid_ids(
+            data['attribute'] for data in attributes_data
+            if 'attribute' in data and 'attribute_name_new' not in data
+        )
+        known_ids = set(ProductAttribute.objects.filter(pk__in=attribute_ids).values_list('pk', flat=True))
+
+        errors = []
+        for data in attributes_data:
+            error = {}
+            if 'attribute_name_new' in data:
+                if not isinstance(data['attribute_name_new'], str) or not data['attribute_name_new']:
+                    error['attribute_name_new'] = "Must be a non-empty string."
+            elif 'attribute' in data:
+                if not str(data['attribute']).isdigit() or int(data['attribute']) not in known_ids:
+                    error['attribute'] = f"Invalid pk \"{data['attribute']}\" - object does not exist."
+            elif 'id' not in data:
+                error['attribute'] = "Either attribute or attribute_name_new must be provided."
+            if 'id' in data and not str(data['id']).isdigit():
+                error['id'] = "A valid integer is required."
+            if 'id' not in data and 'value' not in data:
+                error['value'] = "This field is required."
+            errors.append(error)
+        return errors if any(errors) else []
+
+    @import_products_schema
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_products(self, request):
+        """Stream products in from an uploaded CSV or JSONL file."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.data.get('format') or guess_format(upload.name)
+        if format not in FORMATS:
+            return Response(
+                {"error": f"format must be one of {', '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        create_categories = str(request.data.get('create_categories', 'true')).lower() != 'false'
+        importer = ProductImporter(create_categories=create_categories)
+        try:
+            result = importer.run_file(upload.file, format)
+        except UnicodeDecodeError as exc:
+            # Batches before the bad bytes are committed; say how many
+            return Response(
+                {"error": f"file is not valid UTF-8: {exc}", **importer.result.as_dict()},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(result.as_dict())
+
+    @export_products_schema
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_products(self, request):
+        """Stream every product matching the current filters as JSONL or CSV."""
+        format = request.query_params.get('file_format', 'jsonl')
+        if format not in exporters.FORMATS:
+            return Response(
+                {"error": f"file_format must be one of {', '.join(exporters.FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            exporters.export(queryset, format, build_url=request.build_absolute_uri),
+            content_type=exporters.CONTENT_TYPES[format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{format}"'
+        return response
+
+    # Parameters that do not narrow the product set
+    non_filter_params = {'page', 'page_size', 'pagination', 'cursor', 'count', 'ordering', 'fields', 'expand'}
+
+    @facets_schema
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Count the products per category and per attribute value under the current filters."""
+        params = {key for key in request.query_params if any(request.query_params.getlist(key))}
+        category_ids = request.query_params.getlist('category_obj')
+        if params <= self.non_filter_params | {'category_obj'} and len(category_ids) <= 1:
+            if category_ids and not category_ids[0].isdigit():
+                return Response({"category_obj": ["Enter a whole number."]}, status=status.HTTP_400_BAD_REQUEST)
+            category_id = int(category_ids[0]) if category_ids else None
+            counts = facets.precomputed_counts(category_id)
+        else:
+            counts = facets.live_counts(self.filter_queryset(self.get_queryset()))
+        return Response(facets.format_counts(*counts))
+
+    @cache_stats_schema
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """Report hit/miss counters of the catalog response cache."""
+        return Response(cache.get_stats())
@@ -3,14 +3,27 @@ ASGI config for ravvio project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Every view is synchronous DRF and runs in a thread of the handler's pool.
+Async list/retrieve handlers on the async ORM were tried and not kept: on
+Django 4.2 the async ORM is sync_to_async underneath, and signals and
+MiddlewareMixin hooks take a thread per request too, so they served no more
+concurrent requests per worker than ravvio/wsgi.py with 8 threads. Deploy
+with WSGI until those parts of Django are natively async.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ravvio.settings')
 
 application = get_asgi_application()
+
+# Do the one-off work of the first request now, see ravvio/startup.py
+if settings.WARM_UP_ON_BOOT:
+    from ravvio.startup import warm_up
+    warm_up()
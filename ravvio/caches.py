@@ -0,0 +1,79 @@
+"""
+Environment-driven configuration of the catalog caches.
+
+The catalog response cache (see product/cache.py) is addressed by version
+counters that writes bump. Every worker must see every bump, so both the
+responses and the counters live in a store all workers share:
+
+    REDIS_URL=redis://host:6379/0   Redis, shared by every host (needs the redis package)
+    CATALOG_CACHE_DIR=/path         files, shared by the workers of one host
+                                    (BASE_DIR/catalog_cache by default)
+    CATALOG_CACHE=locmem            process memory, for a single worker only
+
+The counters get their own cache, `catalog_versions`, which never culls:
+a counter culled to make room for a response would come back at a new
+version and throw away every response of its scope.
+
+Process memory is refused when WEB_CONCURRENCY (which gunicorn and most
+hosts read as their worker count) asks for more than one worker.
+"""
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+FILE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+REDIS_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+UNCULLED_FILE_BACKEND = 'ravvio.caches.UnculledFileBasedCache'
+RESPONSE_ENTRIES = 5000
+
+
+class UnculledFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache that never culls. The stock backend lists the whole
+    directory on every set() to count its entries, which grows with the
+    number of counters for no benefit when none may be dropped.
+    """
+
+    def _cull(self):
+        pass
+
+
+def catalog_caches(env, default_directory):
+    """The CACHES entries `catalog` (responses) and `catalog_versions` (counters)."""
+    redis_url = env.get('REDIS_URL')
+    if redis_url:
+        return {
+            'catalog': {'BACKEND': REDIS_BACKEND, 'LOCATION': redis_url, 'KEY_PREFIX': 'catalog'},
+            'catalog_versions': {'BACKEND': REDIS_BACKEND, 'LOCATION': redis_url, 'KEY_PREFIX': 'catalog-versions'},
+        }
+
+    if env.get('CATALOG_CACHE') == 'locmem':
+        workers = int(env.get('WEB_CONCURRENCY') or 1)
+        if workers > 1:
+            raise ImproperlyConfigured(
+                f"CATALOG_CACHE=locmem keeps cache versions per process, but WEB_CONCURRENCY asks for "
+                f"{workers} workers; set REDIS_URL or CATALOG_CACHE_DIR instead."
+            )
+        return {
+            'catalog': {
+                'BACKEND': LOCMEM_BACKEND,
+                'LOCATION': 'catalog',
+                'OPTIONS': {'MAX_ENTRIES': RESPONSE_ENTRIES},
+            },
+            'catalog_versions': {
+                'BACKEND': LOCMEM_BACKEND,
+                'LOCATION': 'catalog-versions',
+                # LocMemCache has no unculled mode; this many counters is never reached
+                'OPTIONS': {'MAX_ENTRIES': 10 ** 9},
+            },
+        }
+
+    directory = env.get('CATALOG_CACHE_DIR') or default_directory
+    return {
+        'catalog': {
+            'BACKEND': FILE_BACKEND,
+            'LOCATION': f'{directory}/responses',
+            'OPTIONS': {'MAX_ENTRIES': RESPONSE_ENTRIES},
+        },
+        'catalog_versions': {'BACKEND': UNCULLED_FILE_BACKEND, 'LOCATION': f'{directory}/versions'},
+    }
@@ -0,0 +1,160 @@
+"""
+Serving MEDIA_ROOT from the app.
+
+`serve_media` streams files with FileResponse, so WSGI servers that offer
+wsgi.file_wrapper send them with sendfile(). It answers single byte ranges
+with 206 (If-Range respected), revalidates with ETag and Last-Modified, and
+marks fingerprinted URLs immutable: content-addressed blobs and image
+variants, whose names carry a digest of their content, and URLs whose `?v=`
+token, which ContentAddressedStorage.url() adds to other names, is the one
+of the file as it is now. Any other `v` is served like a plain URL.
+
+With MEDIA_OFFLOAD set to 'x-sendfile' or 'x-accel-redirect' the view only
+checks the request and leaves the transfer to the front proxy (Apache
+mod_xsendfile, nginx with an internal location at MEDIA_OFFLOAD_PREFIX).
+"""
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from product.storage import file_token, is_blob_name, is_fingerprinted_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+OFFLOAD_HEADERS = {'x-sendfile': 'X-Sendfile', 'x-accel-redirect': 'X-Accel-Redirect'}
+
+
+class FileRange:
+    """The `length` bytes of an open file from `start`, readable like the file itself."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # sendfile() starts at the current offset and sends Content-Length bytes
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, length) of a single byte range, None to send everything, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        start = max(size - suffix, 0)
+        return start, size - start
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+
+def is_fingerprinted(request, path, stat_result):
+    return is_fingerprinted_name(path) or request.GET.get('v') == file_token(stat_result)
+
+
+def file_etag(path, stat_result):
+    match = is_blob_name(path) and re.search(r'[0-9a-f]{64}', path)
+    if match:
+        return f'"{match.group()}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+
+    etag = file_etag(path, stat_result)
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = send_file(request, path, full_path, stat_result.st_size, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_fingerprinted(request, path, stat_result):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def send_file(request, path, full_path, size, etag, last_modified):
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        # The proxy handles ranges itself
+        response = HttpResponse()
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_OFFLOAD_PREFIX.rstrip('/') + '/' + path)
+        else:
+            response[OFFLOAD_HEADERS[offload]] = full_path
+        # Let the proxy pick the type from the file
+        del response['Content-Type']
+        return response
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, length = byte_range
+        response = FileResponse(FileRange(file, start, length), status=206)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    response.block_size = 64 * 1024
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a Range request still applies: its If-Range names the current representation."""
+    validator = request.META.get('HTTP_IF_RANGE')
+    if validator is None:
+        return True
+    if validator.startswith('"') or validator.startswith('W/'):
+        return validator == etag
+    return parse_http_date_safe(validator) == last_modified
@@ -0,0 +1,243 @@
+"""
+Per-route request metrics.
+
+MetricsMiddleware times every request and attributes it to its resolved
+route name (product-list, product-add-images, ...). Per route and method it
+keeps a latency histogram, a histogram of SQL queries per request, and the
+total SQL time, JSON rendering time and response bytes. Each response gets a
+Server-Timing header with the same numbers for that request, and
+/metrics serves the totals in the Prometheus text format.
+
+The numbers live in process memory, so every worker process reports its own
+series; scrape each worker, or sum them in Prometheus.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = 'unmatched'
+
+# The RequestStats of the request being handled, None outside one
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.query_seconds = 0.0
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, method, status, stats, seconds, size):
+        with self.lock:
+            metrics = self.routes.get((route, method))
+            if metrics is None:
+                metrics = self.routes[route, method] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(stats.queries)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.query_seconds += stats.query_seconds
+            metrics.render_seconds += stats.render_seconds
+            metrics.response_bytes += size
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        with self.lock:
+            routes = sorted(self.routes.items())
+            family('ravvio_requests_total', 'counter', 'Requests handled, by route, method and status.', [
+                sample('ravvio_requests_total', labels(route, method, status=status), count)
+                for (route, method), metrics in routes
+                for status, count in sorted(metrics.statuses.items())
+            ])
+            family('ravvio_request_duration_seconds', 'histogram', 'Time spent handling requests.', [
+                line for (route, method), metrics in routes
+                for line in histogram_samples('ravvio_request_duration_seconds', metrics.latency, route, method)
+            ])
+            family('ravvio_request_queries', 'histogram', 'SQL queries run per request.', [
+                line for (route, method), metrics in routes
+                for line in histogram_samples('ravvio_request_queries', metrics.queries, route, method)
+            ])
+            for name, attribute, help in [
+                ('ravvio_query_seconds_total', 'query_seconds', 'Time spent running SQL queries.'),
+                ('ravvio_render_seconds_total', 'render_seconds', 'Time spent rendering response data to JSON.'),
+                ('ravvio_response_bytes_total', 'response_bytes', 'Bytes of non-streaming response bodies.'),
+            ]:
+                family(name, 'counter', help, [
+                    sample(name, labels(route, method), getattr(metrics, attribute))
+                    for (route, method), metrics in routes
+                ])
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def labels(route, method, **extra):
+    pairs = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs.items()) + '}'
+
+
+def sample(name, labels, value):
+    return f'{name}{labels} {value:g}' if isinstance(value, float) else f'{name}{labels} {value}'
+
+
+def histogram_samples(name, histogram, route, method):
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        yield sample(f'{name}_bucket', labels(route, method, le=f'{bound:g}'), count)
+    yield sample(f'{name}_bucket', labels(route, method, le='+Inf'), histogram.count)
+    yield sample(f'{name}_sum', labels(route, method), float(histogram.sum))
+    yield sample(f'{name}_count', labels(route, method), histogram.count)
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that adds its rendering time to the request's render time.
+
+    Only the encoding of the response data is timed; the serializers' or
+    readers' to_representation work happens in the view, before this.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.render_seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Record per-route metrics and add a Server-Timing header to every response."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def finish(self, request, response, stats, seconds):
+        match = request.resolver_match
+        route = match.view_name if match is not None and match.view_name else UNMATCHED_ROUTE
+        size = 0 if response.streaming else len(response.content)
+        registry.record(route, request.method, response.status_code, stats, seconds, size)
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={seconds * 1000:.1f}',
+            f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'render;dur={stats.render_seconds * 1000:.1f}',
+        ])
+        return response
+
+
+def metrics_view(request):
+    """The metrics of this process for Prometheus, for METRICS_TOKEN bearers or staff users."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(authorization, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,136 @@
+"""
+Per-request profiling for staff users.
+
+A staff user who sends `X-Profile: cprofile` gets the cProfile statistics of
+their request back instead of its response, sorted by cumulative time
+(`X-Profile-Sort` picks another pstats key). `X-Profile: sample` instead
+samples the stack of the request thread every PROFILE_SAMPLE_INTERVAL
+seconds, pyinstrument-style, and returns the stacks in the collapsed format
+that flamegraph.pl and speedscope read. Everyone else's requests, and
+requests without the header, pass through untouched.
+
+Under ASGI only the work done on the event loop thread is profiled.
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+MODES = ('cprofile', 'sample')
+SORT_KEYS = ('cumulative', 'tottime', 'calls', 'ncalls', 'time')
+
+
+class Sampler(threading.Thread):
+    """Collect the stacks of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def report(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilerMiddleware:
+    """Profile requests of staff users that ask for it with the X-Profile header."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.get_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        return self.profile(mode, request)
+
+    async def __acall__(self, request):
+        mode = self.get_mode(request)
+        # Loading the user may query the session
+        if mode is None or not await sync_to_async(lambda: request.user.is_staff)():
+            return await self.get_response(request)
+        return await self.aprofile(mode, request)
+
+    @staticmethod
+    def get_mode(request):
+        mode = request.headers.get('X-Profile', '').lower()
+        return mode if mode in MODES else None
+
+    def profile(self, mode, request):
+        if mode == 'sample':
+            sampler = self.start_sampler()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stopped.set()
+                sampler.join()
+            return self.report(sampler.report(), response)
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        return self.report(self.format_stats(profiler, request), response)
+
+    async def aprofile(self, mode, request):
+        if mode == 'sample':
+            sampler = self.start_sampler()
+            try:
+                response = await self.get_response(request)
+            finally:
+                sampler.stopped.set()
+                sampler.join()
+            return self.report(sampler.report(), response)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.report(self.format_stats(profiler, request), response)
+
+    @staticmethod
+    def start_sampler():
+        sampler = Sampler(threading.get_ident(), getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001))
+        sampler.start()
+        return sampler
+
+    @staticmethod
+    def format_stats(profiler, request):
+        sort = request.headers.get('X-Profile-Sort', 'cumulative')
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(sort if sort in SORT_KEYS else 'cumulative')
+        stats.print_stats(getattr(settings, 'PROFILE_STATS_LIMIT', 60))
+        return output.getvalue()
+
+    @staticmethod
+    def report(text, response):
+        report = HttpResponse(text, content_type='text/plain; charset=utf-8')
+        report['X-Profiled-Status'] = response.status_code
+        report['Cache-Control'] = 'no-store'
+        return report
@@ -0,0 +1,118 @@
+"""
+Read-replica routing for the catalog.
+
+Safe-method requests read product app models from one of DATABASE_REPLICAS;
+everything else uses the primary ('default'). A request stays on the primary
+once it writes, and a client that wrote is pinned to the primary for
+REPLICA_STICKY_SECONDS through a cookie, so it reads its own writes while the
+replicas catch up. Other clients are kept on the primary for the same time
+through `pin_recent_writes()`, which the catalog cache calls with the time of
+the last write its versions record (product/cache.py): a response read from a
+lagging replica would otherwise be cached, and given an ETag, as the current
+version. Outside a request (management commands, the shell, background
+threads) every query goes to the primary.
+
+Locally, two SQLite files stand in for primary and replica:
+
+    DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3
+    python manage.py migrate && cp db.sqlite3 replica.sqlite3
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'primary_pin'
+REPLICATED_APPS = {'product'}
+
+# Per request: None outside one, else {'replica': bool, 'wrote': bool}
+_routing = ContextVar('replica_routing', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def pin_recent_writes(write_time_ns):
+    """Keep the current request on the primary if the replicas may still lag behind a write at `write_time_ns`."""
+    state = _routing.get()
+    if state is not None and state['replica'] and write_time_ns > (time.time() - sticky_seconds()) * 1e9:
+        state['replica'] = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is None or not state['replica'] or state['wrote']
+            or model._meta.app_label not in REPLICATED_APPS
+            # Reads inside a transaction must see its writes
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return None
+        replicas = replica_aliases()
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """Decide per request whether the router may use a replica, and pin writers to the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        pinned_until = request.COOKIES.get(STICKY_COOKIE, '')
+        pinned = pinned_until.isdigit() and int(pinned_until) > time.time()
+        return {
+            'replica': request.method in ('GET', 'HEAD', 'OPTIONS') and not pinned,
+            'wrote': request.method not in ('GET', 'HEAD', 'OPTIONS'),
+        }
+
+    def finish(self, state, response):
+        if state['wrote'] and replica_aliases():
+            sticky = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + sticky)), max_age=sticky, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,172 @@
+"""
+The OpenAPI schema, generated once per code version.
+
+Generating the schema walks every viewset and applies the extend_schema
+decorators of product/swagger.py, which costs hundreds of milliseconds of
+CPU, and the docs UIs fetch it on every page load. It only changes with the
+code, so SchemaView serves YAML and JSON renderings made once for the
+current `code_version()`, gzipped ahead of time, from memory and with an
+ETag. `manage.py build_schema` writes them to SCHEMA_CACHE_DIR at deploy
+time; a worker that finds no files for its version generates them on the
+first request and saves them for the others.
+
+Requests with `lang` or `version` parameters get a schema generated for
+them, as before.
+"""
+import functools
+import gzip
+import hashlib
+import os
+import re
+import threading
+import uuid
+from importlib import import_module, metadata
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+RENDERERS = {'yaml': OpenApiYamlRenderer, 'json': OpenApiJsonRenderer}
+PER_REQUEST_PARAMS = {'lang', 'version'}
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+DEPENDENCIES = ('django', 'djangorestframework', 'drf-spectacular')
+
+
+class RenderedSchema:
+    """One rendering of the schema, plain and gzipped."""
+
+    def __init__(self, content, gzipped=None):
+        self.content = content
+        self.gzipped = gzipped if gzipped is not None else gzip.compress(content, mtime=0)
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+def source_paths():
+    """The Python files of the project's own apps and URLconf."""
+    roots = {Path(app.path) for app in apps.get_app_configs() if Path(app.path).is_relative_to(settings.BASE_DIR)}
+    roots.add(Path(import_module(settings.ROOT_URLCONF).__file__).parent)
+    return sorted(path for root in roots for path in root.rglob('*.py'))
+
+
+@functools.lru_cache(maxsize=None)
+def source_version():
+    sha256 = hashlib.sha256()
+    for path in source_paths():
+        sha256.update(str(path.relative_to(settings.BASE_DIR)).encode())
+        sha256.update(path.read_bytes())
+    for dependency in DEPENDENCIES:
+        sha256.update(f'{dependency}=={metadata.version(dependency)}'.encode())
+    sha256.update(repr(sorted(settings.SPECTACULAR_SETTINGS.items())).encode())
+    return sha256.hexdigest()[:16]
+
+
+def code_version():
+    """CODE_VERSION when the deploy sets it (a git commit, say), else a hash of the sources."""
+    return getattr(settings, 'CODE_VERSION', '') or source_version()
+
+
+def generate_schema():
+    """Render the schema in every format, {format: RenderedSchema}."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    data = generator.get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+    return {
+        format: RenderedSchema(renderer().render(data, renderer.media_type, {}))
+        for format, renderer in RENDERERS.items()
+    }
+
+
+def schema_directory(version):
+    return Path(settings.SCHEMA_CACHE_DIR) / version
+
+
+def write_schema(version, schemas):
+    """Save the renderings of `version`, each file written aside and renamed into place."""
+    directory = schema_directory(version)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for format, schema in schemas.items():
+        for path, content in [
+            (directory / f'schema.{format}', schema.content),
+            (directory / f'schema.{format}.gz', schema.gzipped),
+        ]:
+            partial_path = path.with_name(f'{path.name}.{uuid.uuid4().hex}.partial')
+            partial_path.write_bytes(content)
+            os.replace(partial_path, path)
+            paths.append(path)
+    return paths
+
+
+def read_schema(version):
+    directory = schema_directory(version)
+    try:
+        return {
+            format: RenderedSchema(
+                (directory / f'schema.{format}').read_bytes(),
+                (directory / f'schema.{format}.gz').read_bytes(),
+            )
+            for format in RENDERERS
+        }
+    except FileNotFoundError:
+        return None
+
+
+# {code version: {format: RenderedSchema}} of this process
+_schemas = {}
+_lock = threading.Lock()
+
+
+def get_schema():
+    version = code_version()
+    schemas = _schemas.get(version)
+    if schemas is not None:
+        return schemas
+    with _lock:
+        schemas = _schemas.get(version)
+        if schemas is None:
+            schemas = read_schema(version)
+            if schemas is None:
+                schemas = generate_schema()
+                try:
+                    write_schema(version, schemas)
+                except OSError:
+                    # A read-only deploy still serves the schema from memory
+                    pass
+            _schemas.clear()
+            _schemas[version] = schemas
+    return schemas
+
+
+class SchemaView(SpectacularAPIView):
+    """SpectacularAPIView that serves the prebuilt schema of the running code."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if PER_REQUEST_PARAMS & set(request.GET):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        schema = get_schema()[renderer.format]
+        gzipped = bool(ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', '')))
+        etag = schema.gzip_etag if gzipped else schema.etag
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = HttpResponse(schema.gzipped if gzipped else schema.content, content_type=content_type)
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+            response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, None)}"'
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -1,8 +1,17 @@
 from pathlib import Path
-from dotenv import load_dotenv
 import os
 
-load_dotenv()
+from ravvio.caches import catalog_caches
+from ravvio.db import database_config, replica_databases, sqlite_pragmas, sqlite_transaction_mode
+
+# The lean profile, for hosts that start processes on demand, skips reading
+# .env (the host provides the environment) and warms up URL resolution and
+# the serializers before the first request, see ravvio/startup.py
+LEAN_STARTUP = os.getenv('DJANGO_LEAN_STARTUP', '').lower() in ('1', 'true', 'yes', 'on')
+
+if not LEAN_STARTUP:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -35,14 +44,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ravvio.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ravvio.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ravvio.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'ravvio.urls'
@@ -67,14 +79,41 @@ WSGI_APPLICATION = 'ravvio.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# DATABASE_URL picks SQLite or PostgreSQL, see ravvio/db.py
 
 DATABASES = {
+    'default': database_config(os.getenv('DATABASE_URL'), BASE_DIR / 'db.sqlite3', os.environ),
+    **replica_databases(os.getenv('DATABASE_REPLICA_URLS'), BASE_DIR / 'db.sqlite3', os.environ),
+}
+
+# Safe-method catalog reads go to a replica; a client that wrote stays on the
+# primary for REPLICA_STICKY_SECONDS, see ravvio/replicas.py
+DATABASE_ROUTERS = ['ravvio.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# PRAGMAs run on every new SQLite connection; SQLITE_MODE=default disables them,
+# SQLITE_MODE=wal adds WAL
+SQLITE_PRAGMAS = sqlite_pragmas(os.getenv('SQLITE_MODE'))
+SQLITE_TRANSACTION_MODE = sqlite_transaction_mode(os.getenv('SQLITE_MODE'))
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The catalog response cache and its version counters are shared by every
+# worker: Redis with REDIS_URL, else files in CATALOG_CACHE_DIR. See
+# ravvio/caches.py.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    **catalog_caches(os.environ, BASE_DIR / 'catalog_cache'),
 }
 
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_VERSIONS_CACHE_ALIAS = 'catalog_versions'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -100,6 +139,10 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'ravvio.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -117,6 +160,13 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# The schema served at /api/schema/ is generated once per code version and kept
+# here; `manage.py build_schema` writes it at deploy time, see ravvio/schema.py.
+# CODE_VERSION (e.g. the deployed commit) names the version, otherwise a hash
+# of the sources does
+SCHEMA_CACHE_DIR = os.getenv('SCHEMA_CACHE_DIR', os.path.join(BASE_DIR, 'schema_cache'))
+CODE_VERSION = os.getenv('CODE_VERSION', '')
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "https://ravvio.net",
@@ -151,6 +201,36 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Hand media transfers to the front proxy: '' to stream from the app,
+# 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect' (nginx, with an
+# internal location at MEDIA_OFFLOAD_PREFIX aliased to MEDIA_ROOT)
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')
+MEDIA_OFFLOAD_PREFIX = os.getenv('MEDIA_OFFLOAD_PREFIX', '/protected-media/')
+
+# Uploads are hashed while they stream in, for content-addressed product images
+FILE_UPLOAD_HANDLERS = [
+    'product.storage.HashingMemoryFileUploadHandler',
+    'product.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Product image variants: longest edge in pixels per variant name
+PRODUCT_IMAGE_VARIANTS = {
+    'thumb': 160,
+    'medium': 480,
+    'large': 1200,
+}
+# 'thread' encodes variants on a background pool, 'sync' inline after commit
+PRODUCT_IMAGE_PIPELINE = os.getenv('PRODUCT_IMAGE_PIPELINE', 'thread')
+PRODUCT_IMAGE_WORKERS = int(os.getenv('PRODUCT_IMAGE_WORKERS', 2))
+
+# Per-route metrics at /metrics, for staff users or with "Authorization: Bearer
+# <METRICS_TOKEN>"; staff users can profile a request with X-Profile, see
+# ravvio/metrics.py and ravvio/profiling.py
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.001))
+
+# Warm up the process in wsgi.py/asgi.py before it serves requests
+WARM_UP_ON_BOOT = LEAN_STARTUP or os.getenv('DJANGO_WARM_UP', '').lower() in ('1', 'true', 'yes', 'on')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -0,0 +1,18 @@
+"""
+SQLite backend that can open transactions with BEGIN IMMEDIATE.
+
+A deferred BEGIN takes the write lock on the first write, and when another
+connection has committed since the transaction's first read, SQLite fails
+with "database is locked" straight away instead of waiting out busy_timeout.
+Taking the lock up front makes writers queue behind each other. Django 4.2
+has no setting for this (the transaction_mode OPTION arrives in 5.1), so
+SQLITE_TRANSACTION_MODE selects it here.
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        mode = getattr(settings, 'SQLITE_TRANSACTION_MODE', None)
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,58 @@
+"""
+Process start-up.
+
+A cold worker pays for importing and configuring everything its first
+request touches. `lazy_view` keeps rarely used views (the API docs and
+schema, which pull in drf-spectacular's generator and django.test) out of
+URLconf loading until they are first requested. `warm_up`, run by wsgi.py
+and asgi.py when WARM_UP_ON_BOOT is set, does the rest of the first
+request's one-off work before the worker accepts connections: loading the
+URLconfs and compiling their patterns, and building the serializer fields
+the catalog readers cache. This moves work rather than saving it, unless the
+server imports the application before forking its workers (gunicorn
+--preload), which then do it once for all of them.
+
+`manage.py benchmark_startup` measures both.
+"""
+import functools
+
+from django.urls import URLResolver, get_resolver
+from django.utils.module_loading import import_string
+
+
+def lazy_view(view_path, **initkwargs):
+    """The as_view() of the class-based view at `view_path`, imported on its first request."""
+
+    @functools.lru_cache(maxsize=None)
+    def load():
+        return import_string(view_path).as_view(**initkwargs)
+
+    def view(request, *args, **kwargs):
+        return load()(request, *args, **kwargs)
+
+    view.__name__ = view_path.rsplit('.', 1)[1]
+    view.csrf_exempt = True
+    return view
+
+
+def compile_patterns(patterns):
+    for pattern in patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            compile_patterns(pattern.url_patterns)
+
+
+def warm_up():
+    # Imports the URLconfs, and so the views
+    compile_patterns(get_resolver().url_patterns)
+
+    from product.urls import router
+
+    for prefix, viewset, basename in router.registry:
+        for action in ('list', 'retrieve'):
+            view = viewset(action=action, request=None, format_kwarg=None, args=(), kwargs={})
+            view.get_serializer_class()(context={}).fields
+        reader_class = getattr(viewset, 'reader_class', None)
+        if reader_class is not None:
+            # Caches the field names of the default representation
+            reader_class(None)
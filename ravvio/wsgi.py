@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ravvio.settings')
 
 application = get_wsgi_application()
+
+# Do the one-off work of the first request now, see ravvio/startup.py
+if settings.WARM_UP_ON_BOOT:
+    from ravvio.startup import warm_up
+    warm_up()